@@ -0,0 +1,39 @@
+# coding: utf-8
+# brailleMultilineRecorder.py
+# part of brailleMultiline addon for NVDA
+# Travis Roth, travis@travisroth.com
+# A display driver with no hardware behind it that hands every frame to the add-on's frame recorder
+# so the cost of each input can be measured reproducibly.
+
+import sys
+import braille
+import config
+from logHandler import log
+
+RECORDER_MODULE = "globalPlugins.brailleMultiline.frameRecorder"
+
+
+class BrailleDisplayDriver(braille.BrailleDisplayDriver):
+	name = "brailleMultilineRecorder"
+	# Translators: name of the fake braille display used to measure the Braille Multiline add-on
+	description = _("Braille Multiline frame recorder (no display)")
+	isThreadSafe = True
+
+	@classmethod
+	def check(cls):
+		return True
+
+	def __init__(self):
+		super().__init__()
+		try:
+			self.numCells = config.conf["brailleMultiline"]["recorderNumCells"]
+		except KeyError:
+			# the global plugin has not registered its settings yet
+			self.numCells = 80
+		log.debug("brailleMultilineRecorder using " + str(self.numCells) + " cells")
+
+	def display(self, cells):
+		# look the recorder up rather than importing it so a frame written before the global plugin loads does not import it early
+		frameRecorder = sys.modules.get(RECORDER_MODULE)
+		if frameRecorder is not None:
+			frameRecorder.recorder.recordFrame(cells, braille.handler.buffer)
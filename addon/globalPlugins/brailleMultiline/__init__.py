@@ -3,8 +3,11 @@
 # addon for NVDA 
 # Travis Roth, travis@travisroth.com
 
+import os
+import time
 import api 
 import globalPluginHandler
+import globalVars
 import addonHandler
 import config 
 from scriptHandler import script 
@@ -12,6 +15,16 @@ import braille
 import ui 
 from . import brailleBufferMultiline
 from . import objectMonitor 
+from . import translationCache
+from . import translationWorkers
+from . import objectFetch
+from . import frameRecorder
+from . import perfCounters
+from . import traceBuffer
+from . import profileCapture
+from . import settingsSnapshot
+from . import containerPool
+from .segmentLayout import Grid
 
 import wx
 import gui
@@ -20,18 +33,88 @@ from logHandler import log
 #addonHandler.initTranslation() 
 
 #settings
-curBD = braille.handler.display.name + str(braille.handler.displaySize)
+# large and tactile graphics displays have many rows, each may be split into columns
+MAX_LINES = 64
+MAX_COLUMNS = 16
 config.conf.spec["brailleMultiline"] = {
 	"autoCheckUpdate": "boolean(default=True)",
-	"numberOfLines_%s" % curBD: "integer(min=1, default=1, max=5)",
-	"focusLine%s" % curBD: "integer(min=-1, default=-1, max=5)",
-	"objectMonitorSingleLineActivateMoreBuffer%s" % curBD: "boolean(default=True)",
 	"reverseScrollBtns": "boolean(default=False)",
 	"backup_tetherTo": 'string(default="focus")',
 	"backup_autoTether": "boolean(default=True)",
+	# milliseconds, a monitored line re-renders at most once per interval however many events arrive
+	"monitorRefreshInterval": "integer(min=0, default=250, max=5000)",
+	# translations kept by the translation cache, 0 turns it off
+	"translationCacheSize": "integer(min=0, default=256, max=10000)",
+	# cells of the brailleMultilineRecorder fake display
+	"recorderNumCells": "integer(min=1, default=80, max=1000)",
+	# profile capture stops after this many seconds or events, 0 for no limit
+	"profileSeconds": "integer(min=0, default=10, max=600)",
+	"profileEvents": "integer(min=0, default=0, max=100000)",
+	# containers kept for layouts not in use, so switching back to one is instant
+	"containerPoolSize": "integer(min=0, default=4, max=20)",
+	# lines read ahead and behind for scrolling a monitored line, 0 scrolls by moving its caret instead
+	"lineCacheLines": "integer(min=0, default=5, max=100)",
+	# every line shows the focused document, consecutive lines around the caret line
+	"continuousDocument": "boolean(default=False)",
+	# threads translating monitored lines off NVDA's main thread, 0 translates them on it
+	"translationWorkers": "integer(min=0, default=1, max=4)",
+	# milliseconds reading a monitored object may take before it is left alone for a while, 0 reads objects however slow they are
+	"fetchTimeout": "integer(min=0, default=100, max=5000)",
+	# milliseconds between display writes for changes outside the focus line, 0 writes them once per event loop tick
+	"displayWriteInterval": "integer(min=0, default=50, max=1000)",
 }
 bmSettings = config.conf["brailleMultiline"]
-numberOfLines = bmSettings["numberOfLines_%s" % curBD]
+
+# settings per display are keyed by driver name and size, worked out when first needed and again after the display changes
+_displayKey = None
+
+def getDisplayKey():
+	global _displayKey
+	if _displayKey is None:
+		key = braille.handler.display.name + str(braille.handler.displaySize)
+		spec = config.conf.spec["brailleMultiline"]
+		if "numberOfLines_%s" % key not in spec:
+			spec["numberOfLines_%s" % key] = "integer(min=1, default=1, max=%d)" % MAX_LINES
+			spec["numberOfColumns_%s" % key] = "integer(min=1, default=1, max=%d)" % MAX_COLUMNS
+			spec["focusLine%s" % key] = "integer(min=-1, default=-1, max=%d)" % (MAX_LINES * MAX_COLUMNS - 1)
+			spec["objectMonitorSingleLineActivateMoreBuffer%s" % key] = "boolean(default=True)"
+		_displayKey = key
+	return _displayKey
+
+def getConfiguredSegments(key=None):
+	"""The segments set up for the display: the number of lines, or a Grid when lines are split into columns."""
+	key = key or getDisplayKey()
+	lines = bmSettings["numberOfLines_%s" % key]
+	columns = bmSettings["numberOfColumns_%s" % key]
+	return lines if columns == 1 else Grid(lines, columns)
+
+def checkLayout(lines, columns, focusLine, displaySize):
+	"""
+	Why a layout can not be used on a display, None if it can.
+	Every segment needs at least one cell, and the focus line must be one of the segments or -1 for the last.
+	@param displaySize: cells of the display, 0 when none is connected and the cells are not checked
+	@rtype: str
+	"""
+	if not 1 <= lines <= MAX_LINES:
+		# Translators: error in the settings panel when the number of lines is out of range
+		return _("Number of Braille lines must be between 1 and %d.") % MAX_LINES
+	if not 1 <= columns <= MAX_COLUMNS:
+		# Translators: error in the settings panel when the number of segments per line is out of range
+		return _("Segments per line must be between 1 and %d.") % MAX_COLUMNS
+	if displaySize and displaySize // lines // columns < 1:
+		# Translators: error in the settings panel when the lines and segments do not fit the display
+		return _("%d lines of %d segments do not fit a display of %d cells.") % (lines, columns, displaySize)
+	if not -1 <= focusLine < lines * columns:
+		# Translators: error in the settings panel when the focus line is not one of the segments
+		return _("Focus line must be between -1 and %d.") % (lines * columns - 1)
+	return None
+
+def resetDisplayKey():
+	global _displayKey
+	_displayKey = None
+
+# last number of lines saved from the settings panel
+numberOfLines = None
 
 class OptionsPanel(gui.SettingsPanel):
 	
@@ -46,40 +129,78 @@ class OptionsPanel(gui.SettingsPanel):
 		# Translators: label of an edit box
 		numberOfLinesLabel = _("Number of Braille lines:")
 		self.numberOfLinesEdit = sHelper.addLabeledControl(numberOfLinesLabel, wx.TextCtrl)
-		self.numberOfLinesEdit.Value = str(bmSettings["numberOfLines_%s" % curBD])
+		self.numberOfLinesEdit.Value = str(bmSettings["numberOfLines_%s" % getDisplayKey()])
+		# Translators: label of an edit box
+		numberOfColumnsLabel = _("Segments per line:")
+		self.numberOfColumnsEdit = sHelper.addLabeledControl(numberOfColumnsLabel, wx.TextCtrl)
+		self.numberOfColumnsEdit.Value = str(bmSettings["numberOfColumns_%s" % getDisplayKey()])
 		# Translators: label for an edit box
 		focusLabel = _("Focus displayed on line:")
 		self.focusEdit = sHelper.addLabeledControl(focusLabel, wx.TextCtrl)
-		self.focusEdit.Value = str(bmSettings["focusLine%s" % curBD])
+		self.focusEdit.Value = str(bmSettings["focusLine%s" % getDisplayKey()])
 		# Translators: checkbox to set if a second segment (buffer) should be added 
 		self.optionMoreBufferCheckbox = sHelper.addItem(wx.CheckBox(self, label=_("Enable automatic second segment when one line")) )
-		self.optionMoreBufferCheckbox.SetValue(bmSettings["objectMonitorSingleLineActivateMoreBuffer%s" % curBD])
+		self.optionMoreBufferCheckbox.SetValue(bmSettings["objectMonitorSingleLineActivateMoreBuffer%s" % getDisplayKey()])
+
+	def _getLayout(self):
+		# raises ValueError when something other than a number was typed
+		return int(self.numberOfLinesEdit.Value), int(self.numberOfColumnsEdit.Value), int(self.focusEdit.Value)
+
+	def isValid(self):
+		try:
+			lines, columns, focusLine = self._getLayout()
+		except ValueError:
+			# Translators: error in the settings panel when a field is not a number
+			error = _("Number of Braille lines, segments per line and focus line must be numbers.")
+		else:
+			error = checkLayout(lines, columns, focusLine, braille.handler.displaySize)
+		if error is not None:
+			# Translators: title of the error shown for settings that can not be used
+			gui.messageBox(error, _("Braille Multiline Settings"), wx.OK | wx.ICON_ERROR, self)
+			return False
+		return super().isValid()
 
 	def onSave(self):
 		global numberOfLines
-		bmSettings["objectMonitorSingleLineActivateMoreBuffer%s" % curBD] = self.optionMoreBufferCheckbox.IsChecked()
-		numberOfLines = self.numberOfLinesEdit.Value 
-		#rudimentary error checking for user input should tighten up
-		if self.numberOfLinesEdit.Value is not None and int(self.numberOfLinesEdit.Value) < 6:
-			bmSettings["numberOfLines_%s" % curBD] = int(numberOfLines)
-		if self.focusEdit.Value is not None and int(self.focusEdit.Value) <6:
-			bmSettings["focusLine%s" % curBD] = int(self.focusEdit.Value)
+		bmSettings["objectMonitorSingleLineActivateMoreBuffer%s" % getDisplayKey()] = self.optionMoreBufferCheckbox.IsChecked()
+		# isValid() checked the layout fits the display
+		lines, columns, focusLine = self._getLayout()
+		numberOfLines = lines
+		bmSettings["numberOfLines_%s" % getDisplayKey()] = lines
+		bmSettings["numberOfColumns_%s" % getDisplayKey()] = columns
+		bmSettings["focusLine%s" % getDisplayKey()] = focusLine
+		settingsSnapshot.rebuild()
 
 
 class GlobalPlugin(globalPluginHandler.GlobalPlugin):
 	scriptCategory = "BrailleMultiline"
 
-	objToMonitor = {}
-
 	def __init__(self):
 		super().__init__()
 		gui.settingsDialogs.NVDASettingsDialog.categoryClasses.append(OptionsPanel)
+		# settings the hot paths read, refreshed when the config profile changes or is saved or reset
+		settingsSnapshot.register()
+		# skip liblouis for text translated recently such as monitored lines and context regions
+		translationCache.install(settingsSnapshot.get().translationCacheSize)
+		# and translate text for monitored lines on worker threads, leaving the main thread to the focus
+		translationWorkers.install(settingsSnapshot.get().translationWorkers)
+		# leave monitored objects in slow or hung applications alone for a while so they do not hold up braille again and again
+		objectFetch.install()
+		# containers of other layouts and displays, and the (display key, layout key) of the one in use, None for NVDA's own buffer
+		self.containerPool = containerPool.ContainerPool(settingsSnapshot.get().containerPoolSize)
+		self._containerKey = None
+		# ObjectMonitor initiate, one per segment indexed by object so events go straight to their monitors
+		self.objToMonitor = objectMonitor.MonitorRegistry()
 		# set up buffers
-		self.newBrailleBuffer(bmSettings["numberOfLines_%s" % curBD])
+		self.newBrailleBuffer(getConfiguredSegments())
+		self._prebuildContainers()
 		# setting to toggle between one and more buffer when needed for OPtionMonitor more convenience for single line displays
-		self._addBufferWhenOne = bmSettings["objectMonitorSingleLineActivateMoreBuffer%s" % curBD]
-		# ObjectMonitor initiate
-		#self.objToMonitor = {}
+		self._addBufferWhenOne = bmSettings["objectMonitorSingleLineActivateMoreBuffer%s" % getDisplayKey()]
+		# follow display switches and reconnects without restarting NVDA, older NVDA versions lack some of these
+		for name in ("displayChanged", "displaySizeChanged"):
+			action = getattr(braille, name, None)
+			if action is not None:
+				action.register(self.handleDisplayChanged)
 
 	def terminate(self):
 		super(GlobalPlugin, self).terminate()
@@ -88,14 +209,118 @@ class GlobalPlugin(globalPluginHandler.GlobalPlugin):
 		braille.handler.mainBuffer = brailleBufferMultiline.oldMainBuffer
 		braille.handler.buffer = braille.handler.mainBuffer
 		braille.BrailleHandler._doNewObject = brailleBufferMultiline._original_doNewObject 
-
-	def newBrailleBuffer(self, numLines):
-		# @param numLines: number of lines or buffers want either integer, or list of buffer lengths must equal full displaySize
-		# this does not save old buffer reference as it may be used to switch on the fly
-		braille.handler.mainBuffer = brailleBufferMultiline.BrailleBufferContainer(braille.handler, numLines) 
-		braille.handler.mainBuffer.focusBufferNumber = bmSettings["focusLine%s" % curBD]
+		braille.BrailleHandler._doCursorMove = brailleBufferMultiline._original_doCursorMove
+		for name in ("displayChanged", "displaySizeChanged"):
+			action = getattr(braille, name, None)
+			if action is not None:
+				action.unregister(self.handleDisplayChanged)
+		self.objToMonitor.clear()
+		self.containerPool.clear()
+		objectFetch.uninstall()
+		# the cache first so translations still queued for the workers are dropped rather than waited for
+		translationCache.uninstall()
+		translationWorkers.uninstall()
+		perfCounters.disable()
+		profileCapture.capture.stop()
+		settingsSnapshot.unregister()
+
+	def newBrailleBuffer(self, numLines, focusLine=None):
+		# @param numLines: number of lines or buffers want either integer, a segmentLayout.Grid of rows and columns, or list of buffer lengths must equal full displaySize
+		# @param focusLine: segment showing the focus, None for the one set for the display
+		# the container being replaced goes to the pool, so switching back to its layout is a pointer swap
+		key = (getDisplayKey(), containerPool.layoutKey(numLines))
+		if focusLine is None:
+			focusLine = bmSettings["focusLine%s" % getDisplayKey()]
+		container = braille.handler.mainBuffer
+		isContainer = isinstance(container, brailleBufferMultiline.BrailleBufferContainer)
+		if key == self._containerKey and isContainer:
+			container.setLayout(numLines, focusLine)
+			return
+		pooled = self.containerPool.take(key)
+		if pooled is None and isContainer and self._containerKey is not None and self._containerKey[0] == key[0]:
+			# no container of that layout kept, re-lay out this one in place keeping what every segment shows
+			container.setLayout(numLines, focusLine)
+			self._containerKey = key
+			return
+		container = pooled
+		if container is None:
+			container = brailleBufferMultiline.BrailleBufferContainer(braille.handler, numLines) 
+		container.focusBufferNumber = focusLine
+		container.setContinuousDocument(bmSettings["continuousDocument"])
+		self._switchMainBuffer(container)
+		self._containerKey = key
+
+	def _switchMainBuffer(self, buffer):
+		"""Makes buffer the main buffer showing the focus of the one it replaces, which is kept in the pool if it is a container."""
+		previous = braille.handler.mainBuffer
+		if previous is buffer:
+			return
+		previousIsContainer = isinstance(previous, brailleBufferMultiline.BrailleBufferContainer)
+		if previousIsContainer:
+			regions = list(previous.bufferSegments[previous.focusBufferNumber].regions)
+			# nothing reads ahead for a container that is not shown
+			previous.stopReadingAhead()
+			if isinstance(buffer, brailleBufferMultiline.BrailleBufferContainer):
+				# monitored lines stay where they are rather than coming back empty until their monitors read them again
+				buffer.copySegments(previous)
+			if self._containerKey is not None:
+				self.containerPool.put(self._containerKey, previous)
+			else:
+				previous.terminate()
+		else:
+			regions = list(previous.regions)
+		braille.handler.mainBuffer = buffer
 		braille.handler.buffer = braille.handler.mainBuffer
-		braille.handler.handleGainFocus(api.getFocusObject()) 
+		if not regions:
+			# nothing shown yet, e.g. at start up
+			braille.handler.handleGainFocus(api.getFocusObject()) 
+			return
+		if isinstance(buffer, brailleBufferMultiline.BrailleBufferContainer):
+			# the display last showed another buffer
+			buffer.invalidateFrame()
+			buffer.setFocusRegions(regions)
+			buffer.updateDisplay()
+			# monitored lines may have changed while this container was in the pool
+			for monitor in self.objToMonitor:
+				monitor.handleEvent("containerSwitch")
+		else:
+			buffer.clear()
+			buffer.regions.extend(regions)
+			buffer.update()
+			buffer.focus(regions[-1])
+			braille.handler.scrollToCursorOrSelection(regions[-1])
+
+	def _prebuildContainers(self):
+		"""
+		Builds containers for the layouts switched to most into the pool ahead of time:
+		the configured one and one and two lines, which monitoring switches between.
+		"""
+		displayKey = getDisplayKey()
+		for segments in (1, 2, getConfiguredSegments(displayKey)):
+			key = (displayKey, containerPool.layoutKey(segments))
+			if not self.containerPool.maxSize or key == self._containerKey or key in self.containerPool:
+				continue
+			self.containerPool.put(key, brailleBufferMultiline.BrailleBufferContainer(braille.handler, segments))
+
+	def handleDisplayChanged(self, *args, **kwargs):
+		"""Another display or display size: re-lays out the segments keeping what they show, with the new display's number of lines."""
+		resetDisplayKey()
+		container = braille.handler.mainBuffer
+		if not isinstance(container, brailleBufferMultiline.BrailleBufferContainer):
+			# the multiline buffer is switched off
+			return
+		key = getDisplayKey()
+		self._addBufferWhenOne = bmSettings["objectMonitorSingleLineActivateMoreBuffer%s" % key]
+		segments = getConfiguredSegments(key)
+		# the new display has not been written to yet
+		container.invalidateFrame()
+		# while objects are monitored keep their lines, e.g. the second line added to a one line display
+		if containerPool.layoutKey(segments) != containerPool.layoutKey(container.segments) and not self.objToMonitor:
+			self.newBrailleBuffer(segments)
+		else:
+			container.setDisplaySize(braille.handler.displaySize)
+			self._containerKey = (key, containerPool.layoutKey(container.segments))
+		self._prebuildContainers()
 
 	@script(
 	 #description="Display Braille Multiline settings dialog"
@@ -196,16 +421,15 @@ class GlobalPlugin(globalPluginHandler.GlobalPlugin):
 
 	@script(gesture="kb:NVDA+Shift+T")
 	def script_oldBrailleBuffer(self, gesture):
-		braille.handler.mainBuffer = brailleBufferMultiline.oldMainBuffer
-		braille.handler.buffer = braille.handler.mainBuffer
+		self._switchMainBuffer(brailleBufferMultiline.oldMainBuffer)
+		self._containerKey = None
 		#braille.BrailleHandler._doNewObject = brailleBufferMultiline._original_doNewObject 
 
 	@script(gesture="kb:NVDA+shift+y")
 	def script_newBrailleBuffer(self, gesture):
 		# monkey patches
 		#brailleBufferMultiline.oldMainBuffer = braille.handler.mainBuffer
-		braille.handler.mainBuffer = brailleBufferMultiline.BrailleBufferContainer(braille.handler, 1) 
-		braille.handler.buffer = braille.handler.mainBuffer
+		self.newBrailleBuffer(getConfiguredSegments())
 
 	#Objet Monitor
 
@@ -213,19 +437,60 @@ class GlobalPlugin(globalPluginHandler.GlobalPlugin):
 		#focus = api.getFocusObject()
 		focus = api.getNavigatorObject()
 		if self._addBufferWhenOne and braille.handler.mainBuffer.numOfSegments==1: 
-			self.newBrailleBuffer(2)
-		GlobalPlugin.objToMonitor[1] = objectMonitor.ObjectMonitor(focus, bufferNum)
+			# the second line is added for the monitor, so the focus goes on the other one
+			self.newBrailleBuffer(2, focusLine=1 - bufferNum if bufferNum in (0, 1) else None)
+		container = braille.handler.mainBuffer
+		if not isinstance(container, brailleBufferMultiline.BrailleBufferContainer) or bufferNum >= container.numOfSegments:
+			# Translators: message when monitoring is asked for on a line the display does not have
+			ui.message(_("No buffer "+str(bufferNum)))
+			return
+		if bufferNum % container.numOfSegments == container.focusBufferNumber % container.numOfSegments:
+			# Translators: message when monitoring is asked for on the line showing the focus
+			ui.message(_("Buffer "+str(bufferNum)+" shows the focus"))
+			return
+		self.objToMonitor.add(objectMonitor.ObjectMonitor(focus, bufferNum))
 		# Translators: Message announcing monitoring on a buffer
 		ui.message(_("Monitor focus object in buffer "+str(bufferNum)))
 
 	def stopObjectMonitoring(self, bufferNum):
 		braille.handler.mainBuffer.bufferSegments[bufferNum].clear() 
-		if bufferNum in GlobalPlugin.objToMonitor: del GlobalPlugin.objToMonitor[bufferNum]  
-		if self._addBufferWhenOne and len(GlobalPlugin.objToMonitor)==0:
+		self.objToMonitor.remove(bufferNum)
+		if self._addBufferWhenOne and len(self.objToMonitor)==0:
 			self.newBrailleBuffer(1)
 		# Translators: message announcing stopping monitoring on a buffer
 		ui.message(_("Stop monitoring in buffer "+str(bufferNum)))
 
+	def _notifyMonitors(self, obj, eventName):
+		frameRecorder.recorder.noteEvent(eventName)
+		profileCapture.capture.noteEvent()
+		if self.objToMonitor:
+			self.objToMonitor.dispatch(obj, eventName)
+
+	def event_gainFocus(self, obj, nextHandler):
+		frameRecorder.recorder.noteEvent("gainFocus")
+		profileCapture.capture.noteEvent()
+		nextHandler()
+
+	# events that change what a monitored object shows, each only schedules a refresh of that monitor's line
+	def event_nameChange(self, obj, nextHandler):
+		self._notifyMonitors(obj, "nameChange")
+		nextHandler()
+
+	def event_valueChange(self, obj, nextHandler):
+		self._notifyMonitors(obj, "valueChange")
+		nextHandler()
+
+	def event_textChange(self, obj, nextHandler):
+		self._notifyMonitors(obj, "textChange")
+		documentWindow = getattr(braille.handler.mainBuffer, "documentWindow", None)
+		if documentWindow is not None:
+			documentWindow.handleTextChange(obj)
+		nextHandler()
+
+	def event_caret(self, obj, nextHandler):
+		self._notifyMonitors(obj, "caret")
+		nextHandler()
+
 	@script(gesture="kb:NVDA+control+1",
 	 # Translators: input help description for script
 		description=_("Set line 1 to monitor navigator object") )
@@ -240,8 +505,149 @@ class GlobalPlugin(globalPluginHandler.GlobalPlugin):
 
 	@script(gesture="kb:NVDA+control+=")
 	def script_testObjectOne(self, gesture):
-		obj = self.objToMonitor[1]._obj
+		monitor = self.objToMonitor.get(1)
+		if monitor is None:
+			return
+		obj = monitor._obj
 		s = ""
 		s += obj.name + " "
 		s += str(obj.role)
 		ui.message(s)
+
+	@script(
+		# Translators: input help description of the script turning continuous document mode on or off
+		description=_("Turns continuous document mode on or off, showing consecutive lines of the focused document on every braille line")
+	)
+	def script_toggleContinuousDocument(self, gesture):
+		container = braille.handler.mainBuffer
+		if not isinstance(container, brailleBufferMultiline.BrailleBufferContainer):
+			# Translators: message when a command needs the multiline buffer which is switched off
+			ui.message(_("Braille Multiline is off"))
+			return
+		enabled = not bmSettings["continuousDocument"]
+		bmSettings["continuousDocument"] = enabled
+		container.setContinuousDocument(enabled)
+		if enabled:
+			# Translators: message when continuous document mode is turned on
+			ui.message(_("Continuous document on"))
+			return
+		# monitored lines were not redrawn while the document was shown
+		for monitor in self.objToMonitor:
+			monitor.handleEvent("continuousDocument")
+		# Translators: message when continuous document mode is turned off
+		ui.message(_("Continuous document off"))
+
+	def _pageDocument(self, direction):
+		documentWindow = getattr(braille.handler.mainBuffer, "documentWindow", None)
+		if documentWindow is None:
+			# Translators: message when paging needs continuous document mode which is off
+			ui.message(_("Continuous document is off"))
+			return
+		documentWindow.moveCaret(direction * braille.handler.mainBuffer.numOfSegments)
+
+	@script(
+		# Translators: input help description of the script paging forward in continuous document mode
+		description=_("In continuous document mode moves forward by as many lines as the braille display shows"),
+		bypassInputHelp=True
+	)
+	def script_pageDocumentForward(self, gesture):
+		self._pageDocument(1)
+
+	@script(
+		# Translators: input help description of the script paging back in continuous document mode
+		description=_("In continuous document mode moves back by as many lines as the braille display shows"),
+		bypassInputHelp=True
+	)
+	def script_pageDocumentBack(self, gesture):
+		self._pageDocument(-1)
+
+	@script(
+		# Translators: input help description of the script recording frames sent to the display
+		description=_("Starts or stops recording the frames written to the display, for use with the Braille Multiline frame recorder display")
+	)
+	def script_toggleFrameRecording(self, gesture):
+		recorder = frameRecorder.recorder
+		if not recorder.enabled:
+			recorder.start()
+			# Translators: message when frame recording starts
+			ui.message(_("Recording braille frames"))
+			return
+		recorder.stop()
+		path = os.path.join(globalVars.appArgs.configPath, "brailleMultiline-frames-%s.json" % time.strftime("%Y%m%d-%H%M%S"))
+		recorder.save(path)
+		summary = frameRecorder.analyze(recorder.toDict())
+		log.info("brailleMultiline frame recording saved to %s\n%s" % (path, frameRecorder.formatSummary(summary)))
+		# Translators: message when frame recording stops, with the number of events and frames recorded
+		ui.message(_("Recorded {events} events and {frames} frames, {redundant} redundant").format(
+			events=summary["events"], frames=summary["frames"], redundant=summary["redundantWrites"]))
+
+	@script(
+		# Translators: input help description of the script turning timing counters on or off
+		description=_("Turns Braille Multiline timing counters on or off")
+	)
+	def script_toggleTimingCounters(self, gesture):
+		if perfCounters.isEnabled():
+			perfCounters.disable()
+			# Translators: message when timing counters are turned off
+			ui.message(_("Braille Multiline timing off"))
+		else:
+			perfCounters.enable()
+			# Translators: message when timing counters are turned on
+			ui.message(_("Braille Multiline timing on"))
+
+	@script(
+		# Translators: input help description of the script showing timing counters
+		description=_("Shows the Braille Multiline timing counters and saves them to the configuration directory")
+	)
+	def script_dumpTimingCounters(self, gesture):
+		if not perfCounters.stats:
+			# Translators: message when there are no timings to show
+			ui.message(_("No timings recorded, turn Braille Multiline timing on first"))
+			return
+		path = os.path.join(globalVars.appArgs.configPath, "brailleMultiline-timings-%s.json" % time.strftime("%Y%m%d-%H%M%S"))
+		perfCounters.save(path)
+		text = perfCounters.formatTable()
+		if translationCache.cache is not None:
+			text += "\n\ntranslation cache: %(hits)d hits, %(misses)d misses, %(size)d of %(maxSize)d entries" % translationCache.cache.getStats()
+		# Translators: title of the window showing timing counters
+		ui.browseableMessage(text + "\n\n" + path, _("Braille Multiline timings"))
+
+	@script(
+		# Translators: input help description of the script saving the trace of recent braille activity
+		description=_("Saves the trace of recent Braille Multiline activity to the configuration directory")
+	)
+	def script_saveTrace(self, gesture):
+		path = os.path.join(globalVars.appArgs.configPath, "brailleMultiline-trace-%s.txt" % time.strftime("%Y%m%d-%H%M%S"))
+		traceBuffer.traceBuffer.export(path)
+		# Translators: message after saving the trace, with the number of records saved
+		ui.message(_("Saved {count} trace records").format(count=len(traceBuffer.traceBuffer)))
+
+	@script(
+		# Translators: input help description of the script capturing a profile
+		description=_("Starts profiling NVDA for the configured seconds or events to find what makes braille slow, or stops a running capture")
+	)
+	def script_captureProfile(self, gesture):
+		capture = profileCapture.capture
+		if capture.active:
+			capture.stop()
+			return
+		settings = settingsSnapshot.get()
+		seconds = settings.profileSeconds
+		events = settings.profileEvents
+		if not seconds and not events:
+			seconds = 10
+		try:
+			capture.start(globalVars.appArgs.configPath, seconds=seconds, events=events, onDone=self._onProfileCaptured)
+		except ValueError:
+			# another profiler is already running
+			log.debugWarning("brailleMultiline could not start profiling", exc_info=True)
+			# Translators: message when a profile capture can not be started
+			ui.message(_("Could not start profiling"))
+			return
+		# Translators: message when a profile capture starts
+		ui.message(_("Profiling"))
+
+	def _onProfileCaptured(self, path, summary):
+		top = ", ".join("%s %.0f ms" % (function.split(":")[-1], cumulativeTime * 1000.0) for function, calls, ownTime, cumulativeTime in summary[:3])
+		# Translators: message when a profile capture ends, followed by the slowest add-on functions
+		ui.message(_("Profile saved. {top}").format(top=top))
@@ -37,6 +37,16 @@ import textInfos
 import keyboardHandler
 import baseObject 
 import math
+import re
+import time
+from bisect import bisect_left, bisect_right
+from .segmentLayout import SegmentLayout, fitToDisplay
+from .frameRecorder import recorder as frameRecorder
+from . import traceBuffer
+from . import settingsSnapshot
+from . import lineCache
+from .documentWindow import DocumentWindow
+from .traceBuffer import trace
 
 #once not monkey patching BrailleHandler look to remove 
 from utils.security import objectBelowLockScreenAndWindowsIsLocked
@@ -47,6 +57,8 @@ if TYPE_CHECKING:
 
 CONTEXTPRES_SCROLL = "scroll"
 CONTEXTPRES_CHANGEDCONTEXT = "changedContext"
+# a run of blank cells, where word wrap may break a window
+BLANK_RUN = re.compile(b"\x00+")
 
 
 
@@ -59,28 +71,81 @@ class BrailleBufferSegment(braille.BrailleBuffer):
 		"""@param segmentSize: size of a segment of a multiline display
 		@type segmentSize: int
 		"""
+		# dirty tracking: what the cells were last composed from, and a counter bumped on every recompose
+		# so BrailleBufferContainer can tell which segments need splicing into its composite
+		self._composedFrom = None
+		self.generation = 0
+		# set when regions may have been added, removed or replaced since update() last looked at them,
+		# so update() of an untouched non-focus segment returns without walking its regions
+		self._dirty = True
+		# brailleCells as bytes so writeWindow can copy straight into the container frame
+		self._cellBytes = bytearray()
+		# visible regions with where each starts and ends in brailleCells, rebuilt when update() recomposes
+		self._indexedRegions = []
+		self._regionStarts = []
+		self._regionEnds = []
+		self._regionNumbers = {}
+		# start and end of every run of blank cells, rebuilt when update() recomposes
+		self._blankRunStarts = []
+		self._blankRunEnds = []
+		# set by BrailleBufferContainer so display updates go through its frame diffing
+		# and it hears about window moves, set before BrailleBuffer.__init__ sets windowStartPos
+		self.container = None
+		self.segmentNumber = -1
 		super().__init__(handler)
 		self.segmentSize = segmentSize
-		self.isFocusBuffer = False 
+		self._blankCells = memoryview(bytes(segmentSize))
+		self._isFocusBuffer = False
+		# lines read ahead for scrolling a non-focus segment, see lineCache
+		self.lineCache = None
 
 	def append(self, regions):
 		self.regions.append(regions) 
+		self._dirty = True
 
+	def markDirty(self):
+		"""Tells update() to look at the regions again, after they were changed other than through append() or clear()."""
+		self._dirty = True
+
+	def _get_isFocusBuffer(self):
+		return self._isFocusBuffer
+
+	def _set_isFocusBuffer(self, isFocusBuffer):
+		if self._isFocusBuffer and not isFocusBuffer:
+			# NVDA may have updated the focus regions without telling the segment
+			self._dirty = True
+		self._isFocusBuffer = isFocusBuffer
+
+	def setSegmentSize(self, segmentSize):
+		"""Resizes the segment keeping its regions and translations, e.g. when a display of another size is connected."""
+		self.segmentSize = segmentSize
+		self._blankCells = memoryview(bytes(segmentSize))
+
+
+	def _get_windowStartPos(self):
+		return self._windowStartPos
+
+	def _set_windowStartPos(self, pos):
+		self._windowStartPos = pos
+		# the container only rewrites segments whose window or cells changed
+		if self.container is not None:
+			self.container._dirtySegments.add(self.segmentNumber)
+			self.container._staleWindowText.add(self.segmentNumber)
 
 	def _get_windowEndPos(self):
 		endPos = self.windowStartPos + self.segmentSize
 		cellsLen = len(self.brailleCells)
 		if endPos >= cellsLen:
 			return cellsLen
-		if not config.conf["braille"]["wordWrap"]:
+		if not settingsSnapshot.get().wordWrap:
 			return endPos
-		try:
-			# Try not to split words across windows.
-			# To do this, break after the furthest possible space.
-			return min(braille.rindex(self.brailleCells, 0, self.windowStartPos, endPos) + 1,
-				endPos)
-		except ValueError:
-			pass
+		# Try not to split words across windows.
+		# To do this, break after the furthest possible space.
+		index = bisect_left(self._blankRunStarts, endPos) - 1
+		if index >= 0:
+			lastBlank = min(self._blankRunEnds[index], endPos) - 1
+			if lastBlank >= self.windowStartPos:
+				return lastBlank + 1
 		return endPos
 
 	def _set_windowEndPos(self, endPos):
@@ -91,40 +156,36 @@ class BrailleBufferSegment(braille.BrailleBuffer):
 			or whether the braille region that corresponds with the focus represents a multi line edit box.
 		3. Whether word wrap is enabled."""
 		startPos = endPos - self.segmentSize
-		# Loop through the currently displayed regions in reverse order
+		restrictPos = 0
+		settings = settingsSnapshot.get()
+		changedContext = settings.focusContextPresentation == CONTEXTPRES_CHANGEDCONTEXT
+		# Loop through the currently displayed regions in reverse order, starting from the last one that starts before endPos
 		# If focusToHardLeft is set for one of the regions, the display shouldn't scroll further back than the start of that region
-		for region, regionStart, regionEnd in reversed(list(self.regionsWithPositions)):
-			if regionStart<endPos:
-				if region.focusToHardLeft:
-					# Only scroll to the start of this region.
-					restrictPos = regionStart
-					break
-				elif config.conf["braille"]["focusContextPresentation"]!=CONTEXTPRES_CHANGEDCONTEXT:
-					# We aren't currently dealing with context change presentation
-					# thus, we only need to consider the last region
-					# since it doesn't have focusToHardLeftSet, the window start position isn't restricted
-					restrictPos = 0
-					break
-		else:
-			restrictPos = 0
+		index = bisect_left(self._regionStarts, endPos) - 1
+		while index >= 0:
+			if self._indexedRegions[index].focusToHardLeft:
+				# Only scroll to the start of this region.
+				restrictPos = self._regionStarts[index]
+				break
+			elif not changedContext:
+				# We aren't currently dealing with context change presentation
+				# thus, we only need to consider the last region
+				# since it doesn't have focusToHardLeftSet, the window start position isn't restricted
+				break
+			index -= 1
 		if startPos <= restrictPos:
 			self.windowStartPos = restrictPos
 			return
-		if not config.conf["braille"]["wordWrap"]:
+		if not settings.wordWrap:
 			self.windowStartPos = startPos
 			return
-		try:
-			# Try not to split words across windows.
-			# To do this, break after the furthest possible block of spaces.
-			# Find the start of the first block of spaces.
-			# Search from 1 cell before in case startPos is just after a space.
-			startPos = self.brailleCells.index(0, startPos - 1, endPos)
-			# Skip past spaces.
-			for startPos in range(startPos, endPos):
-				if self.brailleCells[startPos] != 0:
-					break
-		except ValueError:
-			pass
+		# Try not to split words across windows.
+		# To do this, break after the furthest possible block of spaces.
+		# Find the first block of spaces ending after 1 cell before in case startPos is just after a space.
+		index = bisect_right(self._blankRunEnds, startPos - 1)
+		if index < len(self._blankRunStarts) and max(self._blankRunStarts[index], startPos - 1) < endPos:
+			# Skip past spaces, stopping at the last cell if they run to endPos.
+			startPos = min(self._blankRunEnds[index], endPos - 1)
 		self.windowStartPos = startPos
 
 
@@ -137,7 +198,7 @@ class BrailleBufferSegment(braille.BrailleBuffer):
 		"""
 		pos = self.regionPosToBufferPos(region, 0)
 		self.windowStartPos = pos
-		if region.focusToHardLeft or config.conf["braille"]["focusContextPresentation"]==CONTEXTPRES_SCROLL:
+		if region.focusToHardLeft or settingsSnapshot.get().focusContextPresentation == CONTEXTPRES_SCROLL:
 			return
 		end = self.windowEndPos
 		if end - pos < self.segmentSize:
@@ -145,6 +206,42 @@ class BrailleBufferSegment(braille.BrailleBuffer):
 			# Force windowStartPos to be recalculated based on windowEndPos.
 			self.windowEndPos = end
 
+	def _indexRegions(self, regions):
+		# same positions regionsWithPositions generates, kept so window calculations can bisect instead
+		starts = []
+		ends = []
+		numbers = {}
+		start = 0
+		for number, region in enumerate(regions):
+			starts.append(start)
+			start += len(region.brailleCells)
+			ends.append(start)
+			numbers.setdefault(region, number)
+		self._indexedRegions = regions
+		self._regionStarts = starts
+		self._regionEnds = ends
+		self._regionNumbers = numbers
+
+	def bufferPosToRegionPos(self, bufferPos):
+		index = bisect_right(self._regionEnds, bufferPos)
+		if index < len(self._indexedRegions):
+			return self._indexedRegions[index], bufferPos - self._regionStarts[index]
+		raise LookupError("No such position")
+
+	def regionPosToBufferPos(self, region, pos, allowNearest=False):
+		index = self._regionNumbers.get(region)
+		if index is not None:
+			start = self._regionStarts[index]
+			end = self._regionEnds[index]
+			if pos < end - start:
+				return start + pos
+			elif allowNearest:
+				return end
+		if allowNearest:
+			# as BrailleBuffer does, the start of the last region
+			return self._regionStarts[-1] if self._regionStarts else 0
+		raise LookupError("No such position")
+
 	def _get_windowBrailleCells(self):
 		cells = self.brailleCells[self.windowStartPos:self.windowEndPos]
 		# cells might not be the full length of the display.
@@ -155,17 +252,79 @@ class BrailleBufferSegment(braille.BrailleBuffer):
 		cells = cells + [0] * (self.segmentSize- len(cells))
 		return cells
 
+	def writeWindow(self, view):
+		"""Copies the visible cells into view padding with spaces, the allocation free counterpart of _get_windowBrailleCells.
+		@param view: this segment's slice of the container frame, segmentSize long
+		@type view: memoryview
+		"""
+		start = self.windowStartPos
+		end = min(max(self.windowEndPos, start), start + len(view))
+		count = end - start
+		view[:count] = memoryview(self._cellBytes)[start:end]
+		view[count:] = self._blankCells[:len(view) - count]
+
+	def clear(self):
+		regions = self.regions
+		super().clear()
+		# BrailleBuffer.clear() swaps in a new list, empty the old one instead
+		# so the container's FakeRegionsList and NVDA's handler keep working on the list the segment shows
+		del regions[:]
+		self.regions = regions
+		if self.lineCache is not None:
+			self.lineCache.cancel()
+			self.lineCache = None
+		self._cellBytes = bytearray()
+		self._indexRegions([])
+		self._blankRunStarts = []
+		self._blankRunEnds = []
+		self.invalidate()
+
+	def invalidate(self):
+		"""Forces the next L{update} to recompose rawText and brailleCells."""
+		self._composedFrom = None
+		self._dirty = True
+
 	def update(self):
+		"""Recomposes rawText and brailleCells only when a visible region was added, removed or retranslated.
+		Region.update() always hands back new lists so comparing against what was composed last time is cheap.
+		Only the focus segment, whose regions NVDA updates directly, is compared every time,
+		other segments are compared when marked dirty by append(), clear() or markDirty().
+		@return: True if the segment was recomposed
+		@rtype: bool
+		"""
+		if not self._dirty and not self._isFocusBuffer:
+			trace(traceBuffer.TRACE_SEGMENT_UPDATE_SKIPPED, self.segmentNumber, len(self.brailleCells), self.generation)
+			return False
+		self._dirty = False
+		composedFrom = [(r, r.rawText, r.brailleCells, r.brailleCursorPos) for r in self.visibleRegions]
+		if composedFrom == self._composedFrom:
+			trace(traceBuffer.TRACE_SEGMENT_UPDATE_SKIPPED, self.segmentNumber, len(self.brailleCells), self.generation)
+			return False
 		super().update()
-		log.debug("BrailleBufferSegment.update %s" % self.rawText)
+		self._cellBytes = bytearray(self.brailleCells)
+		self._indexRegions([r for r, rawText, cells, cursorPos in composedFrom])
+		self._blankRunStarts = []
+		self._blankRunEnds = []
+		for run in BLANK_RUN.finditer(self._cellBytes):
+			self._blankRunStarts.append(run.start())
+			self._blankRunEnds.append(run.end())
+		self._composedFrom = composedFrom
+		self.generation += 1
+		if self.container is not None:
+			self.container._dirtySegments.add(self.segmentNumber)
+			self.container._staleWindowText.add(self.segmentNumber)
+		trace(traceBuffer.TRACE_SEGMENT_UPDATE, self.segmentNumber, len(self.brailleCells), self.generation)
+		return True
 
 	def updateDisplay(self):
 		#if self is self.handler.buffer:
 		# when the braille buffer (BrailleBufferSegment) is active self.handler.buffer is BrailleBufferContainer so this will fail 
-		#why does braille.py need this extra check? 
-		#todo: add check if in BrailleBufferContainer if this is crashy
-		self.handler.update()
-		log.debug("BrailleBufferSegment.updateDisplay is called %s" % self.rawText)
+		# so let the container decide, it skips the write when the frame did not change
+		trace(traceBuffer.TRACE_SEGMENT_UPDATE_DISPLAY, self.segmentNumber, self.windowStartPos, self.windowEndPos)
+		if self.container is not None:
+			self.container.updateDisplay(self.segmentNumber)
+		else:
+			self.handler.update()
 
 
 
@@ -220,27 +379,147 @@ class  BrailleBufferContainer(baseObject.AutoPropertyObject):
 		# @type bufferSegments: list
 		# @precondition: the list of segment sizes must equal total displaySize
 		self.bufferSegments = []
-		self.displaySize = self.handler.displaySize
-		if type(self.segments) == int:
-			# equal length segments divided by displaySize
-			segmentSize = int(self.displaySize / self.segments) #force integer  
-			for i in range(0, segments):
-				self.bufferSegments.append(BrailleBufferSegment(handler, segmentSize))
-				self.numOfSegments = segments
-		elif type(self.segments)==list: 
-			for i in self.segments:
-				self.bufferSegments.append(BrailleBufferSegment(handler, i))
-			self.numOfSegments = len(segments)
+		# segment boundaries worked out once, for both equal length (int) and list layouts
+		layout = SegmentLayout(self.segments, self.handler.displaySize)
+		for segmentSize in layout.sizes:
+			self.bufferSegments.append(BrailleBufferSegment(handler, segmentSize))
+		for i, b in enumerate(self.bufferSegments):
+			b.container = self
+			b.segmentNumber = i
 		self._focusBufferNumber = self.focusBufferNumberDefault = -1 # where should default NVDA focus braille be sent too 
 		self.bufferSegments[self._focusBufferNumber].isFocusBuffer = True 
 		#hack: BrailleHandler likes to write to BrailleBuffer.regions[] directly which is not very OOO in message() and _doNewObject()
 		# make a pointer to our new append method so don't have monkey patch BrailleHandler._doNewObject, handlePendingCaretUpdate
 		self.regions = FakeRegionsList(self, self.bufferSegments[self.focusBufferNumber].regions)
-		self.rawText = ""
+		# cached composite of all segments, see update()
+		self._segmentGenerations = [None] * len(self.bufferSegments)
+		self._segmentRawText = [""] * len(self.bufferSegments)
+		# composite brailleCells offset of each segment, last entry is the total length
+		self._compositeOffsets = [0] * (len(self.bufferSegments) + 1)
+		self._rawText = ""
+		self._rawTextStale = False
 		self.brailleCells = []
 		self.cursorPos = None
+		# continuous document mode, see setContinuousDocument
+		self.documentWindow = None
+		# coalesced writes for non-focus segments, see updateDisplay: whether one is due, a token telling the latest
+		# scheduled flush from stale ones, and when the display was last written
+		self._flushPending = False
+		self._flushToken = 0
+		self._lastWriteTime = 0.0
+		self._applyLayout(layout)
 		log.debug("BrailleBufferContainer initialized")
 
+	def _applyLayout(self, layout):
+		"""Sizes the segments and the frame for layout, which must have one size per segment."""
+		self.layout = layout
+		self.displaySize = layout.displaySize
+		self.numOfSegments = layout.numOfSegments
+		for b, segmentSize in zip(self.bufferSegments, layout.sizes):
+			b.setSegmentSize(segmentSize)
+		# display sized frame the segments write their windows into, one fixed slice per segment
+		self._frame = bytearray(self.displaySize)
+		frameView = memoryview(self._frame)
+		# last frame handed to the display, compared against to skip redundant writes
+		self._lastFrame = bytearray(self.displaySize)
+		lastFrameView = memoryview(self._lastFrame)
+		self._segmentViews = []
+		self._lastSegmentViews = []
+		self._segmentRanges = []
+		for i in range(self.numOfSegments):
+			start, end = self.layout.getSegmentRange(i)
+			self._segmentViews.append(frameView[start:end])
+			self._lastSegmentViews.append(lastFrameView[start:end])
+			self._segmentRanges.append((start, end))
+		# segments to write into the frame on the next compose, and those written since the last frame sent
+		self._dirtySegments = set(range(self.numOfSegments))
+		self._unsentSegments = set()
+		# windowRawText of each segment, and the segments whose window or cells changed since it was sliced
+		self._segmentWindowText = [""] * self.numOfSegments
+		self._staleWindowText = set(range(self.numOfSegments))
+		self._windowRawText = ""
+		self._windowTextWordWrap = None
+		# window ends depend on word wrap, everything is rewritten when it changes
+		self._composedWordWrap = None
+		self._frameSent = False
+		self._lastCursorWindowPos = None
+		# @param changedRanges: (start, end) cell ranges of the segments that differ from the previous frame sent
+		# drivers able to write part of a display can use this from braille.handler.buffer
+		# @type changedRanges: list
+		self.changedRanges = []
+
+	def setDisplaySize(self, displaySize):
+		"""
+		Lays the segments out again for a display of another size, keeping their regions, translations and window start positions.
+		A list of segment sizes that no longer adds up to the display is split equally between the same number of segments instead.
+		@param displaySize: cells of the newly connected display
+		@type displaySize: int
+		"""
+		self.setLayout(self.segments, displaySize=displaySize)
+
+	def setLayout(self, segments, focusBufferNumber=None, displaySize=None):
+		"""
+		Changes the segments in place, without going back to the focus object for its regions.
+		The focus segment keeps its regions, translations and window and becomes the new focus segment,
+		other segments keep theirs while their number still exists and is not the new focus segment.
+		Segments left over are dropped, new ones start empty.
+		A list of segment sizes that does not add up to the display is split equally between the same number of segments instead.
+		@param segments: as for L{__init__}, number of segments or list of segment sizes
+		@type segments: int or list
+		@param focusBufferNumber: the new focus segment, None keeps the current one if it still exists
+		@type focusBufferNumber: int
+		@param displaySize: cells of the display, None for the handler's current displaySize
+		@type displaySize: int
+		"""
+		if displaySize is None:
+			displaySize = self.handler.displaySize
+		layout = SegmentLayout(fitToDisplay(segments, displaySize), displaySize)
+		count = layout.numOfSegments
+		if focusBufferNumber is None:
+			focusBufferNumber = self._focusBufferNumber if self._focusBufferNumber < count else -1
+		elif not (0 <= focusBufferNumber < count or focusBufferNumber == -1):
+			raise LookupError("No such position to set focus buffer")
+		self.segments = segments
+		if layout == self.layout and focusBufferNumber == self._focusBufferNumber:
+			return
+		oldFocus = self.bufferSegments[self._focusBufferNumber]
+		newFocusIndex = focusBufferNumber % count
+		bufferSegments = []
+		for i, segmentSize in enumerate(layout.sizes):
+			if i == newFocusIndex:
+				b = oldFocus
+			elif i < len(self.bufferSegments) and self.bufferSegments[i] is not oldFocus:
+				b = self.bufferSegments[i]
+			else:
+				b = BrailleBufferSegment(self.handler, segmentSize)
+			b.container = self
+			b.segmentNumber = i
+			b.isFocusBuffer = i == newFocusIndex
+			bufferSegments.append(b)
+		for b in self.bufferSegments:
+			if b not in bufferSegments:
+				# dropped, window moves must not mark segment numbers of this container any more
+				b.container = None
+		self.bufferSegments = bufferSegments
+		self._focusBufferNumber = focusBufferNumber
+		self.regions = FakeRegionsList(self, oldFocus.regions)
+		# segments moved so splice them all into the composite again, their own cells are kept
+		self._segmentGenerations = [None] * count
+		self._segmentRawText = [""] * count
+		self._compositeOffsets = [0] * (count + 1)
+		self._rawText = ""
+		self._rawTextStale = False
+		self.brailleCells = []
+		self._applyLayout(layout)
+		if self.documentWindow is not None:
+			# one line per segment, so a window of another length
+			self.documentWindow.invalidate()
+		# keep the cursor visible in the focus segment, other segments keep their window start
+		if oldFocus.regions:
+			self.handler.scrollToCursorOrSelection(oldFocus.regions[-1])
+		self.update()
+		self.updateDisplay()
+
 
 
 	def append(self, region):
@@ -267,46 +546,161 @@ class  BrailleBufferContainer(baseObject.AutoPropertyObject):
 			self.bufferSegments[self._focusBufferNumber].isFocusBuffer = False 
 			self._focusBufferNumber = bufferNum
 			self.bufferSegments[self._focusBufferNumber].isFocusBuffer = True 
+			if self.documentWindow is not None:
+				self.documentWindow.invalidate()
 		else:
 			raise LookupError("No such position to set focus buffer")
 
 	def update(self):
-		self.rawText = ""
-		self.brailleCells = []
+		if self.documentWindow is not None:
+			# put the lines around a moved caret into the other segments before they are spliced in
+			self.documentWindow.sync()
 		self.cursorPos = None
-		start = 0
-		for b in self.bufferSegments:
+		offsets = self._compositeOffsets
+		for i, b in enumerate(self.bufferSegments):
 			b.update()
+			if b.generation == self._segmentGenerations[i]:
+				# nothing changed in this segment since it was last spliced in
+				continue
+			self._segmentGenerations[i] = b.generation
 			# it appears sometimes rawText and brailleCells are accessed at the buffer level direclty instead of through getters
-			self.rawText+= b.rawText
-			self.brailleCells.extend(b.brailleCells)
-			#if b.cursorPos is not None:
-				#self.cursorPos = start + b.cursorPos
-			#start += len(b.brailleCells)
+			# so keep a composite of all segments, splicing in only the segments that were recomposed
+			start, end = offsets[i], offsets[i + 1]
+			self.brailleCells[start:end] = b.brailleCells
+			delta = len(b.brailleCells) - (end - start)
+			if delta:
+				for j in range(i + 1, len(offsets)):
+					offsets[j] += delta
+			self._segmentRawText[i] = b.rawText
+			self._rawTextStale = True
 		#return the cursor from the focus buffer as default BrailleHandler only knows one cursor 
 		if self.bufferSegments[self.focusBufferNumber].cursorPos is not None:
 			self.cursorPos = self.getWindowLeadingCells(self.focusBufferNumber) + self.bufferSegments[self.focusBufferNumber].cursorPos 
 
 
 
-#	def updateDisplay(self):
-#		log.debug("BrailleBufferContainer.updateDisplay ")
-#		if self is self.handler.buffer or self in self.handler.buffer.bufferSegments:
-#			self.handler.update()
+	def _get_rawText(self):
+		# joined lazily as rawText is rarely read compared to how often update() runs
+		if self._rawTextStale:
+			self._rawText = "".join(self._segmentRawText)
+			self._rawTextStale = False
+		return self._rawText
+
+	def updateDisplay(self, segment=None):
+		"""
+		Writes the frame to the display, straight away for the focus segment so typing and focus changes are not held up.
+		Changes to other segments, such as bursts of monitor refreshes, only mark the frame for writing:
+		it is written once on the next tick, and no sooner than displayWriteInterval milliseconds after the last write.
+		@param segment: the segment that changed, None for changes to the whole container which are written straight away
+		@type segment: int
+		"""
+		if segment is None or segment % self.numOfSegments == self.focusBufferNumber % self.numOfSegments:
+			self.flushDisplay()
+			return
+		if self._flushPending:
+			# the frame is already due to be written and will include this segment
+			return
+		self._flushPending = True
+		self._flushToken += 1
+		wait = int((self._lastWriteTime + settingsSnapshot.get().displayWriteInterval / 1000.0 - time.monotonic()) * 1000)
+		trace(traceBuffer.TRACE_DISPLAY_DEFERRED, segment, max(wait, 0), self._flushToken)
+		if wait > 0:
+			wx.CallLater(wait, self._scheduledFlush, self._flushToken)
+		else:
+			wx.CallAfter(self._scheduledFlush, self._flushToken)
+
+	def _scheduledFlush(self, token):
+		# a write since scheduling took the changes along, or a newer flush is due
+		if self._flushPending and token == self._flushToken:
+			self.flushDisplay()
+
+	def flushDisplay(self):
+		"""Writes to the display through BrailleHandler.update() unless neither the cells nor the cursor changed since the last frame."""
+		self._flushPending = False
+		if self is not self.handler.buffer:
+			return
+		if self._frameSent:
+			self._composeFrame()
+			if self.cursorWindowPos == self._lastCursorWindowPos and not self._getChangedSegments():
+				self._unsentSegments.clear()
+				trace(traceBuffer.TRACE_DISPLAY_SKIPPED)
+				return
+		self.handler.update()
+
+	def setContinuousDocument(self, enabled):
+		"""
+		Turns continuous document mode on or off. While on every segment shows a line of the focused document,
+		consecutive in display order around the caret line in the focus segment, see L{DocumentWindow}.
+		Turning it off empties the other segments again.
+		@type enabled: bool
+		"""
+		if enabled == (self.documentWindow is not None):
+			return
+		if enabled:
+			self.documentWindow = DocumentWindow(self)
+		else:
+			self.documentWindow.release()
+			self.documentWindow = None
+		self.update()
+		self.updateDisplay()
+
+	def invalidateFrame(self):
+		"""Forgets the last frame sent so the next updateDisplay writes unconditionally, e.g. after the display was reconnected."""
+		self._frameSent = False
 
 	def _get_windowRawText(self):
 		#since Braille display is treated as one buffer may be best to match _get_windowBrailleCells
-		text = ""
-		for b in self.bufferSegments:
-			text += b._get_windowRawText()
-		return text
+		# read by BrailleHandler.update() on every write, so like the frame only the segments that changed are sliced again
+		wordWrap = settingsSnapshot.get().wordWrap
+		if wordWrap != self._windowTextWordWrap:
+			self._windowTextWordWrap = wordWrap
+			self._staleWindowText.update(range(self.numOfSegments))
+		if self._staleWindowText:
+			for i in self._staleWindowText:
+				self._segmentWindowText[i] = self.bufferSegments[i]._get_windowRawText()
+			self._staleWindowText.clear()
+			self._windowRawText = "".join(self._segmentWindowText)
+		return self._windowRawText
 
 	def _get_windowBrailleCells(self):
 		#since Braille display is treated as one buffer should return all segments' cells
-		cells = []
-		for buf in self.bufferSegments:
-			cells.extend(buf._get_windowBrailleCells())
-		return cells
+		# this is what BrailleHandler.update() sends to the display so remember it as the last frame
+		self._composeFrame()
+		if self._frameSent:
+			changed = self._getChangedSegments()
+			for i in changed:
+				self._lastSegmentViews[i][:] = self._segmentViews[i]
+		else:
+			changed = range(self.numOfSegments)
+			self._lastFrame[:] = self._frame
+		self._unsentSegments.clear()
+		# whoever asked for this write, a flush scheduled for other segments has nothing left to write
+		self._flushPending = False
+		self._lastWriteTime = time.monotonic()
+		self.changedRanges = [self._segmentRanges[i] for i in changed]
+		self._lastCursorWindowPos = self.cursorWindowPos
+		self._frameSent = True
+		trace(traceBuffer.TRACE_DISPLAY_WRITE, -1, len(self.changedRanges),
+			self._lastCursorWindowPos if self._lastCursorWindowPos is not None else -1)
+		# BrailleHandler.update() pads the cells with list concatenation so only convert at this boundary
+		return list(self._frame)
+
+	def _composeFrame(self):
+		"""Writes the windows of segments whose cells or window moved since they were last written into the frame."""
+		wordWrap = settingsSnapshot.get().wordWrap
+		if wordWrap != self._composedWordWrap:
+			self._composedWordWrap = wordWrap
+			self._dirtySegments.update(range(self.numOfSegments))
+		if not self._dirtySegments:
+			return
+		for i in self._dirtySegments:
+			self.bufferSegments[i].writeWindow(self._segmentViews[i])
+		self._unsentSegments.update(self._dirtySegments)
+		self._dirtySegments.clear()
+
+	def _getChangedSegments(self):
+		"""Segments written since the last frame sent that now differ from it, in display order."""
+		return [i for i in sorted(self._unsentSegments) if self._segmentViews[i] != self._lastSegmentViews[i]]
 
 	def _get_visibleRegions(self):
 		for buf in self.bufferSegments:
@@ -343,21 +737,10 @@ class  BrailleBufferContainer(baseObject.AutoPropertyObject):
 		Calculates the buffer segment braillePos is in for multibuffer. If only one buffer will return 0
 		@param braillePos: Braille cursor position urousually vided by routeTo
 		@param braillePos type: int
+		@return: the segment or None if braillePos is past the last segment
 		"""
-		inSegment = 0
-		inSegmentSize = 0
 		#our bufferSegments are 0 based physical routing keys also 0 based
-		if type(self.segments) == int:
-			inSegmentSize = (self.displaySize/self.segments )
-			inSegment = math.floor( braillePos/ inSegmentSize)
-			return inSegment
-		elif type(self.segments) == list:
-			counter = 0
-			for i in self.segments:
-				counter = counter + i
-				if braillePos < counter:
-					return inSegment 
-				inSegment = inSegment+1
+		return self.layout.getSegment(braillePos)
 
 	def getWindowLeadingCells(self, segment):
 		"""
@@ -365,29 +748,18 @@ class  BrailleBufferContainer(baseObject.AutoPropertyObject):
 		@param segment: the 0 based segment 
 		@param type segment: int
 		"""
-		cells = 0
-		segment = len(self.bufferSegments)-1 if segment == -1 else segment 
-		if type(self.segments) == int:
-			size = int((self.displaySize/self.segments ))
-			cells = size*segment
-		elif type(self.segments) == list:
-			if (segment > 0) and (segment < len(self.segments)):
-				for i in range(0, segment):
-					cells += self.segments[i]
-		return cells 
-		
+		return self.layout.getLeadingCells(segment)
 
 	def routeTo(self, braillePos):
-		if braillePos == 79:
-			self.debugBuffer()
-			return 
 		#if display and NVDA think it is one buffer positions after the first buffer wont' match up 
 		#if window mode such as on Orbit slate is supported in firmware what will it send routing wise? 
-		inSegment = self.getBufferSegment(braillePos)
-		segmentSize = int((self.displaySize/self.segments)) if type(self.segments) == int else self.segments[inSegment]
-		#text = "routing " + str(braillePos) + " inSegment " + str(inSegment) + "final routing " + str(int(braillePos%segmentSize))
-		#ui.message(text)
-		self.bufferSegments[inSegment].routeTo( (int(braillePos%segmentSize)) )
+		location = self.layout.locate(braillePos)
+		if location is None:
+			# routing key past the last segment, e.g. leftover cells of an equal length layout
+			return
+		inSegment, segmentPos = location
+		frameRecorder.noteEvent("routeTo", inSegment)
+		self.bufferSegments[inSegment].routeTo(segmentPos)
 
 	def clear(self, segment=-1):
 		if segment is None: 
@@ -404,6 +776,76 @@ class  BrailleBufferContainer(baseObject.AutoPropertyObject):
 			self.bufferSegments[self.focusBufferNumber].isFocusBuffer = True #this should not reset but just  as well check
 			self.regions = FakeRegionsList(self, self.bufferSegments[self.focusBufferNumber].regions)
 
+	def copySegments(self, other):
+		"""
+		Shows what the non-focus segments of other show in the segments of the same number here, other than this container's focus segment,
+		without reading or translating anything again. Segments other has no counterpart for are emptied.
+		Used when this container replaces other as the main buffer, so monitored lines stay on the display.
+		@type other: L{BrailleBufferContainer}
+		"""
+		focusIndex = self.focusBufferNumber % self.numOfSegments
+		otherFocusIndex = other.focusBufferNumber % other.numOfSegments
+		for i, b in enumerate(self.bufferSegments):
+			if i == focusIndex:
+				continue
+			b.clear()
+			if i >= other.numOfSegments or i == otherFocusIndex or not other.bufferSegments[i].regions:
+				continue
+			source = other.bufferSegments[i]
+			b.regions.extend(source.regions)
+			b.update()
+			if b.segmentSize == source.segmentSize:
+				b.windowStartPos = source.windowStartPos
+			else:
+				b.focus(b.regions[-1])
+
+	def stopReadingAhead(self):
+		"""Stops filling the line caches of the segments and drops them, e.g. when the container stops being the main buffer."""
+		for b in self.bufferSegments:
+			if b.lineCache is not None:
+				b.lineCache.cancel()
+				b.lineCache = None
+
+	def terminate(self):
+		"""Stops the container's timers and drops its caches, when it is dropped for good such as from the pool."""
+		self.stopReadingAhead()
+		if self.documentWindow is not None:
+			self.documentWindow.release()
+			self.documentWindow = None
+		# a flush scheduled for this container finds its token stale
+		self._flushPending = False
+		self._flushToken += 1
+
+	def markRegionDirty(self, region):
+		"""
+		Marks the segment showing region for recomposing, as only the focus segment compares its regions on every update().
+		Needed when NVDA updates a region in another segment itself, e.g. BrailleHandler._doCursorMove after scrolling a monitored line.
+		"""
+		segment = getattr(region, "targetSegment", None)
+		if segment is not None and 0 <= segment < self.numOfSegments and region in self.bufferSegments[segment].regions:
+			self.bufferSegments[segment].markDirty()
+			return
+		for b in self.bufferSegments:
+			if region in b.regions:
+				b.markDirty()
+				return
+
+	def setFocusRegions(self, regions):
+		"""
+		Shows regions in the focus segment in place of what it had, without translating them again.
+		Used to carry the focus over from the buffer this container replaces as the main buffer.
+		@param regions: already updated regions, the last one is focused
+		@type regions: list of braille.Region
+		"""
+		segment = self.bufferSegments[self.focusBufferNumber]
+		self.clear()
+		if not regions:
+			return
+		segment.regions.extend(regions)
+		self.update()
+		segment.focus(regions[-1])
+		self.handler.scrollToCursorOrSelection(regions[-1])
+
 # these are BrailleBuffer methods but base class doesn't know to look at multiple buffers so needs redirecting to be plug and play
 	#adding ability to access individual buffers but NVDA is focus driven so liekly mostly will work with focus buffer
 	# last buffer in bufferSegments has the last text written and is being used as default focus buffer
@@ -422,6 +864,7 @@ class  BrailleBufferContainer(baseObject.AutoPropertyObject):
 		# redirect scroll command to a specific segment optional defaults to last buffer should be compatible with old API this way
 		focusTracking = True if (segment ==-1) or (segment == self.focusBufferNumber)  else False 
 		segment = segment if segment >=0 and segment < self.numOfSegments else self.focusBufferNumber 
+		frameRecorder.noteEvent("scrollForward", segment)
 		if focusTracking: 
 			self.bufferSegments[segment].scrollForward() #let default handle it
 		if not focusTracking: 
@@ -429,7 +872,17 @@ class  BrailleBufferContainer(baseObject.AutoPropertyObject):
 			#so we must monitor and do it ourselves duplicating BrailleBuffer.scrollForward here
 			if not self.bufferSegments[segment]._nextWindow():
 				# The window could not be scrolled, so try moving to the next line.
-				if self.bufferSegments[segment].regions:
+				if self.documentWindow is not None and self.documentWindow.source is not None:
+					# the segment shows a line of the focused document, move down it as the focus segment would
+					self.documentWindow.moveCaret(1)
+					return
+				cache = lineCache.getCache(self.bufferSegments[segment])
+				if cache is not None:
+					# read ahead already, show it without moving the caret or focus of the object
+					cache.scroll(1)
+					# scrolled by the user, so written at once like the focus segment
+					self.flushDisplay()
+				elif self.bufferSegments[segment].regions:
 					#save the focus when in same appapplication navigated textInfo focus likes to jump back 
 					savedFocus = api.getFocusObject() 
 					self.bufferSegments[segment].regions[-1].nextLine()
@@ -439,19 +892,27 @@ class  BrailleBufferContainer(baseObject.AutoPropertyObject):
 					if savedFocus != api.getFocusObject(): savedFocus.setFocus()
 			else:
 				# Scrolling succeeded.
-				self.bufferSegments[segment].updateDisplay()
+				self.flushDisplay()
 		return 
 
 	def scrollBack(self, segment=-1):
 		# redirect scroll command to a specific segment optional defaults to last buffer should be compatible with old API this way
 		focusTracking = True if (segment ==-1) or (segment == self.focusBufferNumber)  else False 
 		segment = segment if segment >=0 and segment < self.numOfSegments else self.focusBufferNumber 
+		frameRecorder.noteEvent("scrollBack", segment)
 		if focusTracking:  
 			self.bufferSegments[segment].scrollBack() # let default
 		if not focusTracking: 
 			if not self.bufferSegments[segment]._previousWindow():
 				# The window could not be scrolled, so try moving to the previous line.
-				if self.bufferSegments[segment].regions:
+				if self.documentWindow is not None and self.documentWindow.source is not None:
+					self.documentWindow.moveCaret(-1)
+					return
+				cache = lineCache.getCache(self.bufferSegments[segment])
+				if cache is not None:
+					cache.scroll(-1)
+					self.flushDisplay()
+				elif self.bufferSegments[segment].regions:
 					#try to keep focus from jumping
 					savedFocus = api.getFocusObject() 
 					self.bufferSegments[segment].regions[-1].previousLine()
@@ -460,7 +921,7 @@ class  BrailleBufferContainer(baseObject.AutoPropertyObject):
 					if savedFocus != api.getFocusObject(): savedFocus.setFocus() 
 			else:
 				# Scrolling succeeded.
-				self.bufferSegments[segment].updateDisplay()
+				self.flushDisplay()
 		return 
 
 	
@@ -574,32 +1035,35 @@ class  BrailleBufferContainer(baseObject.AutoPropertyObject):
 def _doNewObjectMultiBuffer(self, regionIterator):
 	#BrailleHandler._doNewObject does not know that the list of regions can now cover mutliple buffers and therefore objects with ancestors 
 	# to keep focusToHardLeft working sort the regions into buffer specific lists first
+	# NVDA's braille settings and commands change config.conf without any notification, so take a fresh settings snapshot on focus changes
+	settingsSnapshot.rebuild()
 	buffers = self.mainBuffer.numOfSegments if hasattr(self.mainBuffer, "numOfSegments") else 1
 	#log.debug("doNewObjectMultiBuffer has numOfSegments " + str(buffers))
 	if buffers > 1:
-		#sort
-		regions = list(regionIterator) 
-		log.debug("doNewObject regions received "+ str(len(regions)) )
-		for x in range(buffers): #look for targetSegment 0-buffers not most efficient but not that many objects 
-			targeted = [] 
-			for r in regions:
-				if hasattr(r, "targetSegment") : 
-					if r.targetSegment == x:  targeted.append(r) 
-				#end inner for
-			log.debug("not default buffer "+ str(x) +" doNewObject with non targeted segments " + str(len(targeted)))
-			if len(targeted) > 0: 
-				braille.handler.mainBuffer.clear(x) 
-				_doNewObjectOriginalWithoutClear(self, targeted) 
-		# default regions made by NVDA don't have targetSegment do them last
+		#sort in one pass, keeping the order regions arrived in within each buffer
+		buckets = [[] for x in range(buffers)]
 		targeted = []
-		for r in regions:
+		count = 0
+		for r in regionIterator:
+			count += 1
 			if not hasattr(r, "targetSegment"):
-				targeted.append(r) 
-			#end for
-		log.debug("final doNewObject with non targeted segments " + str(len(targeted)))
+				targeted.append(r)
+			elif 0 <= r.targetSegment < buffers:
+				buckets[r.targetSegment].append(r)
+			#targetSegment out of range for this layout is not displayed
+		trace(traceBuffer.TRACE_NEW_OBJECT, -1, count, len(targeted))
+		# fill every segment first so the container is composed and the display written once, not once per segment
+		focusRegions = []
+		for x in range(buffers):
+			if buckets[x]:
+				trace(traceBuffer.TRACE_NEW_OBJECT_SEGMENT, x, len(buckets[x]))
+				braille.handler.mainBuffer.clear(x) 
+				focusRegions.append(_appendNewObjectRegions(self, buckets[x]))
+		# default regions made by NVDA don't have targetSegment do them last
 		if len(targeted) > 0: 
 			braille.handler.mainBuffer.clear() #Focus buffer default
-			_doNewObjectOriginalWithoutClear(self, targeted)
+			focusRegions.append(_appendNewObjectRegions(self, targeted))
+		_showNewObjectRegions(self, focusRegions)
 
 	else:
 		#do original
@@ -612,12 +1076,18 @@ def _doNewObjectMultiBuffer(self, regionIterator):
 # removing clear need handle more specifically in _doNewObjectMultiBuffer
 def _doNewObjectOriginalWithoutClear(self, regions):
 	#self.mainBuffer.clear()
+	_showNewObjectRegions(self, [_appendNewObjectRegions(self, regions)])
+
+# first half of _doNewObject, returns the region to focus
+def _appendNewObjectRegions(self, regions):
 	focusToHardLeftSet = False
+	# neither changes while the regions are added so check once rather than per region
+	checkHardLeft = (
+		self.getTether() == TetherTo.FOCUS.value
+		and settingsSnapshot.get().focusContextPresentation == CONTEXTPRES_CHANGEDCONTEXT
+	)
 	for region in regions:
-		if (
-			self.getTether() == TetherTo.FOCUS.value
-			and config.conf["braille"]["focusContextPresentation"] == CONTEXTPRES_CHANGEDCONTEXT
-		):
+		if checkHardLeft:
 			# Check focusToHardLeft for every region.
 			# If noone of the regions has focusToHardLeft set to True, set it for the first focus region.
 			if region.focusToHardLeft:
@@ -629,21 +1099,38 @@ def _doNewObjectOriginalWithoutClear(self, regions):
 				region.focusToHardLeft = True
 				focusToHardLeftSet = True
 		self.mainBuffer.regions.append(region)
+	return region
+
+# second half of _doNewObject for the last region of every object just appended
+def _showNewObjectRegions(self, focusRegions):
 	self.mainBuffer.update()
-	# Last region should receive focus.
-	self.mainBuffer.focus(region)
-	self.scrollToCursorOrSelection(region)
+	for region in focusRegions:
+		# Last region should receive focus.
+		self.mainBuffer.focus(region)
+		self.scrollToCursorOrSelection(region)
 	if self.buffer is self.mainBuffer:
-		self.update()
+		if hasattr(self.mainBuffer, "flushDisplay"):
+			# skips the write when the frame is what the display already shows
+			self.mainBuffer.flushDisplay()
+		else:
+			self.update()
 	elif self.buffer is self.messageBuffer and keyboardHandler.keyCounter>self._keyCountForLastMessage:
 		self._dismissMessage()
 
+#braille.BrailleHandler
+def _doCursorMoveMultiBuffer(self, region):
+	# the region may be in a non-focus segment, whose update() would otherwise skip it
+	if hasattr(self.mainBuffer, "markRegionDirty"):
+		self.mainBuffer.markRegionDirty(region)
+	_original_doCursorMove(self, region)
+
 #braille.BrailleHandler
 def _get_shouldAutoTetherMonkey(self) -> bool:
 	#when buffer not in focus tethering could be a problem
 	isFocus = False 
 	if hasattr(self, "isFocusBuffer"):
 		isFocus = self.isFocusBuffer 
+	# read live rather than from the snapshot, BrailleHandler.setTether changes it without a config profile switch, save or reset
 	return isFocus and self.enabled and config.conf["braille"]["tetherTo"] == TetherTo.AUTO.value
 braille.BrailleHandler._get_shouldAutoTether = _get_shouldAutoTetherMonkey
 
@@ -669,7 +1156,7 @@ def monkey_handleCaretMove(
 	elif prevTether == TetherTo.REVIEW.value:
 		# The caret moved in a different object than the review position.
 		self._doNewObject(getFocusRegions(obj, review=False))
-	log.debug("caret moved in region %s" % region.rawText)
+	trace(traceBuffer.TRACE_CARET_MOVE, -1, len(region.rawText) if region else -1, int(bool(region and region.pendingCaretUpdate)))
 
 def monkey_handlePendingCaretUpdate(self):
 	"""Checks to see if the final text region needs its caret updated and if so calls _doCursorMove for the region."""
@@ -679,7 +1166,7 @@ def monkey_handlePendingCaretUpdate(self):
 			self._doCursorMove(region)
 		finally:
 			region.pendingCaretUpdate=False
-	log.debug("caret pending update in region %s" % region.rawText)
+	trace(traceBuffer.TRACE_PENDING_CARET_UPDATE, -1, len(region.rawText) if region else -1)
 
 def monkey_doCursorMove(self, region):
 	self.mainBuffer.saveWindow()
@@ -691,7 +1178,7 @@ def monkey_doCursorMove(self, region):
 		self.update()
 	elif self.buffer is self.messageBuffer and keyboardHandler.keyCounter>self._keyCountForLastMessage:
 		self._dismissMessage()
-	log.debug("do_cursor_move in region %s" % region.rawText)
+	trace(traceBuffer.TRACE_CURSOR_MOVE, -1, len(region.rawText), region.cursorPos if region.cursorPos is not None else -1)
 
 def scrollForwardMonkey(self):
 	if not self._nextWindow():
@@ -717,6 +1204,8 @@ def scrollForwardMonkey(self):
 #braille.BrailleHandler._doCursorMove = monkey_doCursorMove
 _original_doNewObject = braille.BrailleHandler._doNewObject
 braille.BrailleHandler._doNewObject = _doNewObjectMultiBuffer
+_original_doCursorMove = braille.BrailleHandler._doCursorMove
+braille.BrailleHandler._doCursorMove = _doCursorMoveMultiBuffer
 oldMainBuffer = braille.handler.mainBuffer
 #initialize here because _doNewObject is being monkey patched and that is causing errors before globalPlugin loads needeed if global plugin crashing
 #braille.handler.mainBuffer = BrailleBufferContainer(braille.handler, 1) 
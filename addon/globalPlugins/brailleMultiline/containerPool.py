@@ -0,0 +1,65 @@
+# coding: utf-8
+# containerPool.py
+# part of brailleBufferMultiline
+# addon for NVDA
+# Travis Roth, travis@travisroth.com
+# Keeps BrailleBufferContainers that are not in use so switching back to a layout does not build one again.
+
+from collections import OrderedDict
+from typing import (
+	Any,
+	Hashable,
+	List,
+	Optional,
+	Tuple,
+	Union,
+)
+from .segmentLayout import Grid
+
+
+def layoutKey(segments: Union[int, Grid, List[int]]) -> Union[int, Tuple]:
+	"""Hashable form of the segments a container was built with."""
+	if isinstance(segments, Grid):
+		# a Grid compares equal to a plain tuple of the same sizes
+		return ("grid", segments.rows, segments.columns)
+	return segments if isinstance(segments, int) else tuple(segments)
+
+
+class ContainerPool(object):
+	"""
+	Inactive containers keyed by (display key, layout key), least recently used dropped past maxSize.
+	A container taken out is no longer in the pool, put it back when it stops being the main buffer.
+	Containers dropped from the pool are terminated.
+	"""
+
+	def __init__(self, maxSize: int = 4) -> None:
+		self.maxSize = maxSize
+		self._containers = OrderedDict()
+
+	def __len__(self):
+		return len(self._containers)
+
+	def __contains__(self, key):
+		return key in self._containers
+
+	def take(self, key: Hashable) -> Optional[Any]:
+		return self._containers.pop(key, None)
+
+	def put(self, key: Hashable, container: Any) -> None:
+		self._containers[key] = container
+		self._containers.move_to_end(key)
+		self._evict()
+
+	def resize(self, maxSize: int) -> None:
+		self.maxSize = maxSize
+		self._evict()
+
+	def clear(self) -> None:
+		for container in self._containers.values():
+			container.terminate()
+		self._containers.clear()
+
+	def _evict(self):
+		while len(self._containers) > self.maxSize:
+			key, container = self._containers.popitem(last=False)
+			container.terminate()
@@ -0,0 +1,195 @@
+# coding: utf-8
+# documentWindow.py
+# part of brailleBufferMultiline
+# addon for NVDA
+# Travis Roth, travis@travisroth.com
+# Continuous document mode: the segments show consecutive lines of the focused document in display order,
+# so a multiline display reads a page of it instead of one line of it and unrelated lines.
+
+from collections import deque
+import braille
+import textInfos
+from logHandler import log
+from .lineCache import readLine
+
+
+class DocumentWindow(object):
+	"""
+	Lines of the focused text region, one per segment of a container in display order.
+	The focus segment shows the caret line as NVDA renders it, the other segments fixed LineRegions of the lines around it.
+	The lines are a deque: when the caret moves a few lines it is rotated and only the lines coming into view are read and translated.
+	Moving further than there are segments reads them all again starting from the caret, however long the document is.
+	"""
+
+	def __init__(self, container):
+		self.container = container
+		# the focus TextInfoRegion the lines were read from and its reading info when they were lined up with it
+		self.source = None
+		self._syncedInfo = None
+		# (info collapsed at the start of the line, LineRegion) per segment, None past either end of the document
+		self._lines = deque()
+
+	def invalidate(self):
+		"""Reads every line again on the next sync, e.g. after the document's text or the segments changed."""
+		self.source = None
+		self._syncedInfo = None
+
+	def release(self):
+		"""Empties the segments the lines are shown in, when the mode is turned off."""
+		self._clearLines()
+		self.invalidate()
+
+	def handleTextChange(self, obj):
+		if self.source is not None and self.source.obj == obj:
+			# lines may have been inserted or removed, so the cached positions are no longer lines
+			self.invalidate()
+
+	def sync(self):
+		"""
+		Lines the other segments up with the caret line of the focus segment, called by the container before it updates.
+		Only puts regions into segments, writing to the display is left to whoever is updating the container.
+		"""
+		container = self.container
+		focusSegment = container.bufferSegments[container.focusBufferNumber]
+		source = focusSegment.regions[-1] if focusSegment.regions else None
+		if not isinstance(source, braille.TextInfoRegion) or getattr(source, "_readingInfo", None) is None:
+			if self.source is not None or self._lines:
+				self.release()
+			return
+		if source is self.source and source._readingInfo is self._syncedInfo:
+			# TextInfoRegion.update() makes a new reading info every time, so nothing moved
+			return
+		caret = source._readingInfo.copy()
+		caret.collapse()
+		shift = None
+		if source is self.source and len(self._lines) == container.numOfSegments:
+			shift = self._findShift(caret, source)
+		self.source = source
+		self._syncedInfo = source._readingInfo
+		try:
+			if shift is None:
+				self._rebuild(source, caret)
+			elif shift:
+				self._shift(source, shift)
+		except Exception:
+			# the object may have died, show only the focus segment until the caret moves again
+			log.debugWarning("documentWindow could not read lines", exc_info=True)
+			self._clearLines()
+			return
+		self._show()
+
+	def moveCaret(self, lines):
+		"""
+		Moves the caret of the document by lines, negative for back, in one move,
+		so the window follows with one batch of reads and one display write when NVDA handles the caret event.
+		@return: False if the caret could not move, e.g. at the end of the document
+		@rtype: bool
+		"""
+		source = self.source
+		if source is None:
+			return False
+		dest = source._readingInfo.copy()
+		dest.collapse()
+		if not dest.move(textInfos.UNIT_LINE, lines):
+			return False
+		source._setCursor(dest)
+		return True
+
+	def _focusIndex(self):
+		return self.container.focusBufferNumber % self.container.numOfSegments
+
+	def _findShift(self, caret, source):
+		"""Lines the caret moved by if its line is still in the window, None if it is not or the caret line's text changed."""
+		lines = self._lines
+		focusIndex = self._focusIndex()
+		entry = lines[focusIndex]
+		if entry[0].compareEndPoints(caret, "startToStart") == 0:
+			# moved within the line, if its text was edited the lines after it may have changed too
+			return 0 if entry[1].rawText.rstrip() == source.rawText.rstrip() else None
+		# lines are in document order with None only past the ends, so bisect the ones there are
+		first = 0
+		while lines[first] is None:
+			first += 1
+		last = len(lines) - 1
+		while lines[last] is None:
+			last -= 1
+		low, high = first, last
+		while low <= high:
+			middle = (low + high) // 2
+			comparison = lines[middle][0].compareEndPoints(caret, "startToStart")
+			if comparison == 0:
+				return middle - focusIndex
+			if comparison < 0:
+				low = middle + 1
+			else:
+				high = middle - 1
+		if first < low <= last:
+			# between two lines of the window, so they are not the lines they were
+			return None
+		# past an edge of the window, e.g. the line after the caret line when the focus segment is the last one
+		# walk on from that edge for less than a window of lines, further than that reading them all again is no slower
+		edge, step = (last, 1) if low > last else (first, -1)
+		info = lines[edge][0].copy()
+		for index in range(edge + step, focusIndex + step * len(lines), step):
+			if not info.move(textInfos.UNIT_LINE, step):
+				return None
+			comparison = info.compareEndPoints(caret, "startToStart")
+			if comparison == 0:
+				return index - focusIndex
+			if comparison == step:
+				return None
+		return None
+
+	def _rebuild(self, source, caret):
+		count = self.container.numOfSegments
+		focusIndex = self._focusIndex()
+		lines = [None] * count
+		lines[focusIndex] = (caret, readLine(source, caret))
+		for index in range(focusIndex + 1, count):
+			lines[index] = self._readNext(source, lines[index - 1], 1)
+		for index in range(focusIndex - 1, -1, -1):
+			lines[index] = self._readNext(source, lines[index + 1], -1)
+		self._lines = deque(lines, maxlen=count)
+
+	def _shift(self, source, shift):
+		"""Drops shift lines off one end, reading as many onto the other, each from the line next to it."""
+		lines = self._lines
+		if shift > 0:
+			for i in range(shift):
+				lines.append(self._readNext(source, lines[-1], 1))
+		else:
+			for i in range(-shift):
+				lines.appendleft(self._readNext(source, lines[0], -1))
+
+	def _readNext(self, source, neighbour, step):
+		if neighbour is None:
+			return None
+		info = neighbour[0].copy()
+		if not info.move(textInfos.UNIT_LINE, step):
+			return None
+		return (info, readLine(source, info))
+
+	def _show(self):
+		focusIndex = self._focusIndex()
+		for index, segment in enumerate(self.container.bufferSegments):
+			if index == focusIndex:
+				continue
+			entry = self._lines[index] if index < len(self._lines) else None
+			if entry is None:
+				if segment.regions:
+					segment.clear()
+				continue
+			region = entry[1]
+			if len(segment.regions) == 1 and segment.regions[0] is region:
+				continue
+			segment.clear()
+			segment.regions.append(region)
+			segment.update()
+			segment.focus(region)
+
+	def _clearLines(self):
+		self._lines = deque()
+		focusIndex = self._focusIndex()
+		for index, segment in enumerate(self.container.bufferSegments):
+			if index != focusIndex and segment.regions:
+				segment.clear()
@@ -0,0 +1,137 @@
+# coding: utf-8
+# frameRecorder.py
+# part of brailleBufferMultiline
+# addon for NVDA
+# Travis Roth, travis@travisroth.com
+# Records what reaches the display (through the brailleMultilineRecorder display driver)
+# together with the events that caused it, and analyzes the recording.
+# Kept free of NVDA imports so recordings can be analyzed outside NVDA.
+
+import json
+import time
+from typing import (
+	Any,
+	Dict,
+	List,
+	Optional,
+	Tuple,
+)
+
+
+class FrameRecorder(object):
+	"""
+	Frames written to the display and the events noted before them, with time.perf_counter() timestamps.
+	Off until start() is called, noteEvent() is just an attribute check while off.
+	"""
+
+	def __init__(self, maxFrames: int = 20000) -> None:
+		self.enabled = False
+		self.maxFrames = maxFrames
+		self.events: List[Dict[str, Any]] = []
+		self.frames: List[Dict[str, Any]] = []
+
+	def start(self) -> None:
+		self.events = []
+		self.frames = []
+		self.enabled = True
+
+	def stop(self) -> None:
+		self.enabled = False
+
+	def noteEvent(self, name: str, segment: Optional[int] = None) -> None:
+		"""Notes an input or object event that may lead to frames being written."""
+		if not self.enabled:
+			return
+		self.events.append({"t": time.perf_counter(), "name": name, "segment": segment})
+
+	def recordFrame(self, cells: List[int], buffer=None) -> None:
+		"""Called by the display driver for every frame written.
+		@param buffer: braille.handler.buffer at the time, to record segment boundaries when it is a BrailleBufferContainer
+		"""
+		if not self.enabled or len(self.frames) >= self.maxFrames:
+			return
+		layout = getattr(buffer, "layout", None)
+		self.frames.append({
+			"t": time.perf_counter(),
+			"cells": bytes(cells).hex(),
+			"segments": [layout.getSegmentRange(i) for i in range(layout.numOfSegments)] if layout is not None else None,
+			"changed": list(getattr(buffer, "changedRanges", None) or []),
+			# index of the event that triggered this frame, the last one noted before it
+			"event": len(self.events) - 1 if self.events else None,
+		})
+
+	def toDict(self) -> Dict[str, Any]:
+		return {"events": self.events, "frames": self.frames}
+
+	def save(self, path: str) -> None:
+		with open(path, "w", encoding="utf-8") as f:
+			json.dump(self.toDict(), f)
+
+
+def _percentile(values: List[float], percent: float) -> float:
+	ordered = sorted(values)
+	return ordered[min(int(len(ordered) * percent / 100.0), len(ordered) - 1)]
+
+
+def analyze(recording: Dict[str, Any]) -> Dict[str, Any]:
+	"""
+	Summarizes a recording from FrameRecorder.toDict() or a saved file.
+	latency is from an event to the first frame written after it, in milliseconds.
+	A redundant write is a frame with exactly the same cells as the frame before it.
+	"""
+	events = recording["events"]
+	frames = recording["frames"]
+	framesPerEvent = [0] * len(events)
+	latencies = []
+	redundant = 0
+	previousCells = None
+	for frame in frames:
+		if frame["cells"] == previousCells:
+			redundant += 1
+		previousCells = frame["cells"]
+		index = frame["event"]
+		if index is None:
+			continue
+		if framesPerEvent[index] == 0:
+			latencies.append((frame["t"] - events[index]["t"]) * 1000.0)
+		framesPerEvent[index] += 1
+	byName: Dict[str, Tuple[int, int]] = {}
+	for event, count in zip(events, framesPerEvent):
+		eventCount, frameCount = byName.get(event["name"], (0, 0))
+		byName[event["name"]] = (eventCount + 1, frameCount + count)
+	summary = {
+		"events": len(events),
+		"frames": len(frames),
+		"redundantWrites": redundant,
+		"eventsWithoutFrame": framesPerEvent.count(0),
+		"framesPerEvent": float(len([f for f in frames if f["event"] is not None])) / len(events) if events else 0.0,
+		"framesPerEventByName": {name: float(f) / e for name, (e, f) in byName.items()},
+	}
+	if latencies:
+		summary["latencyMs"] = {
+			"min": min(latencies),
+			"median": _percentile(latencies, 50),
+			"p95": _percentile(latencies, 95),
+			"max": max(latencies),
+		}
+	return summary
+
+
+def formatSummary(summary: Dict[str, Any]) -> str:
+	lines = [
+		"events: %d" % summary["events"],
+		"frames: %d" % summary["frames"],
+		"frames per event: %.2f" % summary["framesPerEvent"],
+		"redundant writes: %d" % summary["redundantWrites"],
+		"events without a frame: %d" % summary["eventsWithoutFrame"],
+	]
+	latency = summary.get("latencyMs")
+	if latency:
+		lines.append("event to frame ms: min %.2f median %.2f p95 %.2f max %.2f" % (
+			latency["min"], latency["median"], latency["p95"], latency["max"]))
+	for name, perEvent in sorted(summary["framesPerEventByName"].items()):
+		lines.append("  %s: %.2f frames per event" % (name, perEvent))
+	return "\n".join(lines)
+
+
+recorder = FrameRecorder()
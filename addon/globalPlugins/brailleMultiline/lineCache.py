@@ -0,0 +1,240 @@
+# coding: utf-8
+# lineCache.py
+# part of brailleBufferMultiline
+# addon for NVDA
+# Travis Roth, travis@travisroth.com
+# Lines before and after the one a non-focus segment shows, translated ahead of time,
+# so scrolling a monitored line by line does not move the caret or focus of the monitored object.
+
+import braille
+import textInfos
+import wx
+from logHandler import log
+from . import settingsSnapshot
+from . import translationCache
+from . import translationWorkers
+from . import objectFetch
+
+# milliseconds between filling lines, so input is handled in between
+FILL_INTERVAL = 20
+
+
+class LineRegion(braille.TextInfoRegion):
+	"""
+	One line of an object at a fixed position rather than at its caret.
+	update() is the expensive part, reading and translating the line, and is done while filling the cache.
+	"""
+
+	def __init__(self, obj, info):
+		super().__init__(obj)
+		self._lineInfo = info
+
+	def _getSelection(self):
+		return self._lineInfo.copy()
+
+
+def readLine(source, info):
+	"""
+	Reads and translates the line at info as a LineRegion of source's object, going to the same segment as source.
+	@param source: the TextInfoRegion the line comes from
+	@param info: collapsed at the start of the line, kept by the region
+	"""
+	region = LineRegion(source.obj, info)
+	targetSegment = getattr(source, "targetSegment", None)
+	if targetSegment is not None:
+		region.targetSegment = targetSegment
+	region.update()
+	return region
+
+
+class LineCache(object):
+	"""
+	Lines around the text region a segment showed when the cache was made, keyed by their distance from it in lines.
+	The segment shows the line at position, lines up to size away from it either way are kept translated.
+	"""
+
+	def __init__(self, segment, source, size):
+		"""
+		@param segment: the BrailleBufferSegment showing source
+		@param source: the TextInfoRegion last put in the segment, its line is distance 0
+		@param size: lines kept ahead and behind
+		"""
+		self.segment = segment
+		self.source = source
+		self.size = size
+		self.position = 0
+		info = source._readingInfo.copy()
+		info.collapse()
+		self._lines = {0: (info, source)}
+		# first distances forwards and backwards where there is no line, once known
+		self._end = None
+		self._start = None
+		self._pendingFill = None
+		# what a worker is translating for the line last filled, see _fillStep
+		self._translating = None
+
+	def isCurrent(self):
+		"""Whether the segment still shows this cache's lines, rather than something refreshed since."""
+		if self.segment.lineCache is not self or not self.segment.regions:
+			return False
+		region = self.segment.regions[-1]
+		return region is self._lines[self.position][1]
+
+	def scroll(self, direction):
+		"""
+		Shows the next (1) or previous (-1) line in the segment, reading it now if filling has not got there yet.
+		@return: False if there is no line that way or the object did not answer in time
+		"""
+		# the line may be one a worker has not translated yet
+		self._finishTranslating()
+		target = self.position + direction
+		segment = self.segment
+		try:
+			entry = self._lines.get(target) or self._fetch(target)
+		except objectFetch.FetchTimeout:
+			objectFetch.markStale(segment)
+			return False
+		if entry is None:
+			return False
+		self.position = target
+		region = entry[1]
+		objectFetch.unmarkStale(segment)
+		segment.regions[-1] = region
+		segment.markDirty()
+		segment.update()
+		if segment.container is not None:
+			segment.container.update()
+		segment.focus(region)
+		segment.updateDisplay()
+		self._evict()
+		self.scheduleFill()
+		return True
+
+	def scheduleFill(self):
+		if self._pendingFill is None and self._translating is None and self._nextMissing() is not None:
+			self._pendingFill = wx.CallLater(FILL_INTERVAL, self._fillStep)
+
+	def cancel(self):
+		if self._pendingFill is not None:
+			self._pendingFill.Stop()
+			self._pendingFill = None
+
+	def _fillStep(self):
+		self._pendingFill = None
+		if not self.isCurrent():
+			return
+		distance = self._nextMissing()
+		if distance is None:
+			return
+		workers = translationWorkers.workers
+		deferred = translationCache.DeferredTranslations() if workers is not None else None
+		try:
+			entry = translationCache.runDeferring(deferred, lambda: self._fetch(distance))
+		except objectFetch.FetchTimeout as timeout:
+			# the application is not answering, fill on once it has been left alone for a while
+			self._pendingFill = wx.CallLater(int(timeout.retryAfter * 1000), self._fillStep)
+			return
+		if entry is not None and deferred:
+			# go on filling once a worker translated the line, scrolling to it before then translates it itself
+			self._translating = deferred
+			workers.submit(deferred, self._translated)
+			return
+		self.scheduleFill()
+
+	def _translated(self):
+		if self._translating is None or not self.isCurrent():
+			return
+		self._finishTranslating()
+		self.scheduleFill()
+
+	def _finishTranslating(self):
+		deferred = self._translating
+		if deferred is not None:
+			self._translating = None
+			translationWorkers.retranslate([region for info, region in self._lines.values()], deferred)
+
+	def _nextMissing(self):
+		"""Closest distance within size of position still to read, the line after before the line before."""
+		for offset in range(1, self.size + 1):
+			for distance in (self.position + offset, self.position - offset):
+				if distance in self._lines:
+					continue
+				if (self._end is not None and distance >= self._end) or (self._start is not None and distance <= self._start):
+					continue
+				return distance
+		return None
+
+	def _fetch(self, distance):
+		"""
+		Reads and translates the line at distance, walking from the line next to it which is read first if needed.
+		@raise objectFetch.FetchTimeout: the object did not answer or is being left alone for a while
+		"""
+		if distance in self._lines:
+			return self._lines[distance]
+		if (self._end is not None and distance >= self._end) or (self._start is not None and distance <= self._start):
+			return None
+		# walk from the side of the line shown, lines on the far side of distance 0 may have been evicted
+		step = 1 if distance > self.position else -1
+		neighbour = self._lines.get(distance - step) or self._fetch(distance - step)
+		if neighbour is None:
+			return None
+		try:
+			entry = objectFetch.fetch(
+				objectFetch.getObjectKey(self.source.obj),
+				lambda: self._read(neighbour[0], step)
+			)
+		except objectFetch.FetchTimeout:
+			raise
+		except Exception:
+			# the object may have died, scrolling falls back to moving its caret
+			log.debugWarning("lineCache could not read a line", exc_info=True)
+			return None
+		return self._store(distance, entry)
+
+	def _read(self, neighbourInfo, step):
+		info = neighbourInfo.copy()
+		if not info.move(textInfos.UNIT_LINE, step):
+			return None
+		return (info, readLine(self.source, info))
+
+	def _store(self, distance, entry):
+		if entry is None:
+			# no line that way, the document ends there
+			if distance > 0:
+				self._end = distance
+			else:
+				self._start = distance
+			return None
+		self._lines[distance] = entry
+		return entry
+
+	def _evict(self):
+		for distance in [d for d in self._lines if abs(d - self.position) > self.size]:
+			del self._lines[distance]
+
+
+def prime(segment):
+	"""
+	Starts reading ahead for a non-focus segment whose last region is a text region, replacing any cache it had.
+	@return: the segment's cache, None if it has none
+	"""
+	if segment.lineCache is not None:
+		segment.lineCache.cancel()
+		segment.lineCache = None
+	size = settingsSnapshot.get().lineCacheLines
+	if not size or segment.isFocusBuffer or not segment.regions:
+		return None
+	source = segment.regions[-1]
+	if not isinstance(source, braille.TextInfoRegion) or getattr(source, "_readingInfo", None) is None:
+		return None
+	segment.lineCache = LineCache(segment, source, size)
+	segment.lineCache.scheduleFill()
+	return segment.lineCache
+
+
+def getCache(segment):
+	"""The segment's cache if it still matches what the segment shows, otherwise a new one."""
+	cache = segment.lineCache
+	if cache is not None and cache.isCurrent():
+		return cache
+	return prime(segment)
@@ -0,0 +1,159 @@
+# coding: utf-8
+# objectFetch.py
+# part of brailleBufferMultiline
+# addon for NVDA
+# Travis Roth, travis@travisroth.com
+# Keeps one hung or slow application from holding up braille again and again.
+# Objects are read on NVDA's main thread like the rest of NVDA does, where the watchdog cancels calls into an application that stopped answering.
+# The first slow or hung read still holds up the main thread until it returns or is cancelled, nothing here shortens it.
+# What is avoided is the reads after it: a read that was cancelled or took longer than fetchTimeout leaves the object alone for a while,
+# longer each time in a row, and meanwhile its segment keeps what was read last, marked as stale.
+
+import time
+from typing import (
+	Any,
+	Callable,
+	Dict,
+	Optional,
+	Tuple,
+)
+import braille
+import watchdog
+from comtypes import COMError
+from logHandler import log
+from NVDAObjects import NVDAObject
+from . import settingsSnapshot
+
+# seconds an object that keeps missing its deadline is left alone for at most
+MAX_BACKOFF = 30.0
+# all eight dots, shown before the content of a stale segment
+STALE_CELL = 0xFF
+# HRESULT of a COM call the watchdog cancelled because the application did not answer
+RPC_E_CALL_CANCELED = -2147418081
+
+
+def getObjectKey(obj: NVDAObject) -> Optional[int]:
+	"""Bucket of an object that is the same for the object reached by object navigation and for the ones in its events: its window handle.
+	Event IDs can not be used, only objects NVDA made for an event have them, so matches still need confirming with ==.
+	"""
+	return getattr(obj, "windowHandle", None)
+
+
+class FetchTimeout(Exception):
+	"""Reading an object was cancelled by the watchdog, or it is being left alone for a while after missing its deadline."""
+
+	def __init__(self, retryAfter: float) -> None:
+		super().__init__("object did not answer in time, retry after %.3f seconds" % retryAfter)
+		# @param retryAfter: seconds until the object is read again
+		self.retryAfter = retryAfter
+
+
+class ObjectFetcher(object):
+	"""
+	Reads objects on the main thread, timing each read against fetchTimeout milliseconds.
+	fetchTimeout does not bound a read, which can not be interrupted from here: a hung read blocks until NVDA's watchdog cancels it.
+	It only decides whether the object is read again straight away.
+	What a slow read returned is still used, but like a cancelled read it counts as a miss,
+	and each miss in a row doubles how long the object is not read again.
+	Used from the main thread only.
+	"""
+
+	def __init__(self) -> None:
+		# object key: (misses in a row, monotonic time it may be read again)
+		self._backoff: Dict[Optional[int], Tuple[int, float]] = {}
+
+	def fetch(self, key: Optional[int], func: Callable[[], Any]) -> Any:
+		"""
+		@param key: the object's key from L{getObjectKey}
+		@param func: reads the object, its exceptions other than a cancelled call are raised here
+		@return: what func returned
+		@raise FetchTimeout: the watchdog cancelled func or it was not run, see L{FetchTimeout.retryAfter}
+		"""
+		timeout = settingsSnapshot.get().fetchTimeout / 1000.0
+		if timeout <= 0:
+			return func()
+		now = time.monotonic()
+		misses, retryAt = self._backoff.get(key, (0, 0.0))
+		if now < retryAt or watchdog.isAttemptingRecovery:
+			raise FetchTimeout(max(retryAt - now, timeout))
+		try:
+			result = func()
+		except watchdog.CallCancelled:
+			raise FetchTimeout(self._miss(key, misses, timeout))
+		except COMError as error:
+			if error.hresult != RPC_E_CALL_CANCELED:
+				raise
+			raise FetchTimeout(self._miss(key, misses, timeout))
+		if time.monotonic() - now > timeout:
+			# answered, but too slowly to read again straight away
+			self._miss(key, misses, timeout)
+		else:
+			self._backoff.pop(key, None)
+		return result
+
+	def _miss(self, key, misses, timeout):
+		misses += 1
+		backoff = min(timeout * 2 ** misses, MAX_BACKOFF)
+		self._backoff[key] = (misses, time.monotonic() + backoff)
+		log.debugWarning("brailleMultiline object %r missed its deadline %d times in a row, leaving it for %.1f seconds" % (key, misses, backoff))
+		return backoff
+
+	def clear(self) -> None:
+		self._backoff.clear()
+
+
+class StaleRegion(braille.Region):
+	"""Put in front of what a segment shows when its object stopped answering: a cell with all dots, then a space."""
+
+	def update(self):
+		self.rawText = "  "
+		self.brailleCells = [STALE_CELL, 0]
+		self.brailleToRawPos = [0, 1]
+		self.rawToBraillePos = [0, 1]
+		self.brailleCursorPos = None
+
+
+def markStale(segment) -> None:
+	"""Marks what segment shows as out of date, until it is cleared for new content or L{unmarkStale} is called."""
+	if not segment.regions or isinstance(segment.regions[0], StaleRegion):
+		return
+	marker = StaleRegion()
+	marker.update()
+	segment.regions.insert(0, marker)
+	segment.markDirty()
+	segment.update()
+	if segment.container is not None:
+		segment.container.update()
+	segment.focus(segment.regions[-1])
+	segment.updateDisplay()
+
+
+def unmarkStale(segment) -> None:
+	"""Takes the stale mark off, the caller updates the segment."""
+	if segment.regions and isinstance(segment.regions[0], StaleRegion):
+		del segment.regions[0]
+		segment.markDirty()
+
+
+fetcher = None
+
+
+def fetch(key: Optional[int], func: Callable[[], Any]) -> Any:
+	"""L{ObjectFetcher.fetch} when installed, otherwise just calls func."""
+	if fetcher is None:
+		return func()
+	return fetcher.fetch(key, func)
+
+
+def install() -> ObjectFetcher:
+	global fetcher
+	if fetcher is None:
+		fetcher = ObjectFetcher()
+	return fetcher
+
+
+def uninstall() -> None:
+	global fetcher
+	if fetcher is not None:
+		fetcher.clear()
+		fetcher = None
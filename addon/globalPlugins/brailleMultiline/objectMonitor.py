@@ -5,8 +5,11 @@
 # Travis Roth, travis@travisroth.com
 
 import braille
+import collections
 import config
+import eventHandler
 from logHandler import log
+import time
 import types
 import typing
 from typing import (
@@ -26,8 +29,114 @@ import controlTypes
 import api
 import textInfos
 from NVDAObjects import NVDAObject
+import wx
+from . import settingsSnapshot
+from . import lineCache
+from . import translationCache
+from . import translationWorkers
+from . import objectFetch
+from .objectFetch import getObjectKey
 #import copy 
 
+# events that refresh a monitored object, see GlobalPlugin.event_nameChange and friends
+MONITORED_EVENTS = ("nameChange", "valueChange", "textChange", "caret")
+# monitors using each (eventName, processId, windowClassName) this add-on asked NVDA for
+_requestedEvents = collections.Counter()
+
+
+def requestEvents(obj):
+	"""
+	Asks NVDA to deliver the monitored events of obj's window while it is in the background,
+	which it otherwise drops as only the foreground application's events reach plugins.
+	@return: the (eventName, processId, windowClassName) entries to give back to releaseEvents
+	"""
+	processId = getattr(obj, "processID", None)
+	windowClassName = getattr(obj, "windowClassName", None)
+	if not processId or not windowClassName:
+		return []
+	entries = []
+	for eventName in MONITORED_EVENTS:
+		entry = (eventName, processId, windowClassName)
+		if not _requestedEvents[entry]:
+			if entry in eventHandler._acceptEvents:
+				# an app module or another add-on asked for it and owns it
+				continue
+			eventHandler.requestEvents(eventName=eventName, processId=processId, windowClassName=windowClassName)
+		_requestedEvents[entry] += 1
+		entries.append(entry)
+	return entries
+
+
+def releaseEvents(entries):
+	"""
+	Stops NVDA delivering events requestEvents asked for once no monitor uses them.
+	NVDA has no call for this, it only forgets a process's requests when the process exits, so its sets are edited directly.
+	"""
+	for entry in entries:
+		_requestedEvents[entry] -= 1
+		if _requestedEvents[entry]:
+			continue
+		del _requestedEvents[entry]
+		eventHandler._acceptEvents.discard(entry)
+		processEvents = eventHandler._acceptEventsByProcess.get(entry[1])
+		if processEvents is not None:
+			processEvents.discard(entry)
+			if not processEvents:
+				del eventHandler._acceptEventsByProcess[entry[1]]
+
+
+class MonitorRegistry():
+	"""
+	ObjectMonitors keyed by the segment they display on and indexed by the window of their object
+	so an event is only checked against the monitors of objects in its window.
+	"""
+
+	def __init__(self) -> None:
+		self._bySegment: Dict[int, "ObjectMonitor"] = {}
+		self._byObject: Dict[Optional[int], List["ObjectMonitor"]] = {}
+
+	def __len__(self):
+		return len(self._bySegment)
+
+	def __iter__(self):
+		return iter(list(self._bySegment.values()))
+
+	def __contains__(self, bufferNum):
+		return bufferNum in self._bySegment
+
+	def get(self, bufferNum: int) -> Optional["ObjectMonitor"]:
+		return self._bySegment.get(bufferNum)
+
+	def add(self, monitor: "ObjectMonitor") -> None:
+		"""Adds a monitor, replacing any monitor already on its segment."""
+		self.remove(monitor.bufferNum)
+		self._bySegment[monitor.bufferNum] = monitor
+		self._byObject.setdefault(monitor.objectKey, []).append(monitor)
+
+	def remove(self, bufferNum: int) -> Optional["ObjectMonitor"]:
+		monitor = self._bySegment.pop(bufferNum, None)
+		if monitor is None:
+			return None
+		monitors = self._byObject[monitor.objectKey]
+		monitors.remove(monitor)
+		if not monitors:
+			del self._byObject[monitor.objectKey]
+		monitor.terminate()
+		return monitor
+
+	def clear(self) -> None:
+		for bufferNum in list(self._bySegment):
+			self.remove(bufferNum)
+
+	def dispatch(self, obj: NVDAObject, eventName: str) -> None:
+		monitors = self._byObject.get(getObjectKey(obj))
+		if not monitors:
+			return
+		for monitor in monitors:
+			if monitor.isMonitoring(obj):
+				monitor.handleEvent(eventName)
+
+
 class ObjectMonitor():
 	def __init__(self, obj: NVDAObject, bufferNum: int) -> None:
 		# @param obj: NVDAObject to track such as navigator object
@@ -35,17 +144,118 @@ class ObjectMonitor():
 		# @type bufferNum: int
 		self._bufferNum = bufferNum
 		self._obj = obj 
+		self.objectKey = getObjectKey(obj)
 		# copy of the bufferSegments object tsthat generated holding Braille regions
 		self._buffer = None 
+		# coalescing: pending wx.CallLater for the next refresh and when the last one ran
+		self._pendingRefresh = None
+		self._lastRefresh = 0.0
+		# bumped whenever the object is read and by terminate, so translations that finish after a newer read are dropped
+		self._generation = 0
+		# the object is usually not in the foreground application, whose events are all NVDA delivers unasked
+		self._requestedEvents = requestEvents(obj)
 		self.loadBuffer()
 		#self.saveBuffer() 
 		log.info("objectMonitor set on " +str(self._bufferNum) + " role "+str(self._obj.role))
 
 	def loadBuffer(self):
 		#braille.handler._doNewObject(self.getRegions())
-		#let's try just copying the buffer
-		fb = braille.handler.mainBuffer.focusBufferNumber 
-		braille.handler.mainBuffer.bufferSegments[self._bufferNum].regions = braille.handler.mainBuffer.bufferSegments[fb].regions  
+		# render the monitored object itself rather than aliasing the focus buffer regions so it can refresh on its own
+		self.refresh()
+
+	@property
+	def bufferNum(self) -> int:
+		return self._bufferNum
+
+	def isMonitoring(self, obj: NVDAObject) -> bool:
+		return obj == self._obj
+
+	def handleEvent(self, eventName: str) -> None:
+		"""Called by the GlobalPlugin for name, value, text and caret events of the monitored object.
+		Bursts of events are coalesced into at most one refresh per monitorRefreshInterval milliseconds.
+		"""
+		if self._pendingRefresh is not None:
+			# a refresh is already due and will pick this change up too
+			return
+		interval = settingsSnapshot.get().monitorRefreshInterval / 1000.0
+		wait = self._lastRefresh + interval - time.monotonic()
+		self._pendingRefresh = wx.CallLater(max(int(wait * 1000), 0), self.refresh)
+
+	def _getSegment(self):
+		"""The segment this monitor shows in, None when there is none to show in."""
+		container = braille.handler.mainBuffer
+		if not hasattr(container, "bufferSegments") or self._bufferNum >= len(container.bufferSegments):
+			# the multiline buffer is switched off or has fewer lines now
+			return None
+		if container.documentWindow is not None:
+			# every segment shows the focused document, the line is redrawn when the mode is turned off
+			return None
+		if self._bufferNum % container.numOfSegments == container.focusBufferNumber % container.numOfSegments:
+			# NVDA writes the focus there, the line is redrawn once the focus moves to another line
+			return None
+		return container.bufferSegments[self._bufferNum]
+
+	def refresh(self):
+		"""
+		Re-renders the monitored object into its own segment, leaving the other segments alone.
+		A slow or hung object is left alone for a while, see objectFetch, and the segment keeps what was read last marked as stale.
+		Text read on the main thread that is not in the translation cache is translated by the workers
+		and the segment changes once they are done, so monitored lines do not hold up typing or focus changes.
+		"""
+		self._pendingRefresh = None
+		self._lastRefresh = time.monotonic()
+		segment = self._getSegment()
+		if segment is None:
+			return
+		workers = translationWorkers.workers
+		# the translations this refresh misses, handed to the workers along with the regions waiting for them
+		deferred = translationCache.DeferredTranslations() if workers is not None else None
+		try:
+			regions = objectFetch.fetch(self.objectKey, lambda: translationCache.runDeferring(deferred, self._readRegions))
+		except objectFetch.FetchTimeout as timeout:
+			# the application is not answering, try again once it has been left alone for a while
+			objectFetch.markStale(segment)
+			self._pendingRefresh = wx.CallLater(int(timeout.retryAfter * 1000), self.refresh)
+			return
+		except Exception:
+			# the object may have died, keep showing what we had
+			log.debugWarning("objectMonitor could not refresh buffer " + str(self._bufferNum), exc_info=True)
+			return
+		self._generation += 1
+		if deferred:
+			generation = self._generation
+			workers.submit(deferred, lambda: self._applyTranslated(segment, regions, deferred, generation))
+			return
+		self._show(segment, regions)
+
+	def _readRegions(self):
+		return list(self.getRegions())
+
+	def _applyTranslated(self, segment, regions, deferred, generation):
+		"""Shows regions the workers translated, unless the monitor refreshed or stopped or the segment went since."""
+		if generation != self._generation or self._getSegment() is not segment:
+			return
+		translationWorkers.retranslate(regions, deferred)
+		self._show(segment, regions)
+
+	def _show(self, segment, regions):
+		segment.clear()
+		for region in regions:
+			segment.append(region)
+		segment.container.update()
+		if regions:
+			segment.focus(regions[-1])
+		segment.updateDisplay()
+		# read the lines around it in the background for scrolling this segment
+		lineCache.prime(segment)
+
+	def terminate(self):
+		self._generation += 1
+		releaseEvents(self._requestedEvents)
+		self._requestedEvents = []
+		if self._pendingRefresh is not None:
+			self._pendingRefresh.Stop()
+			self._pendingRefresh = None
 
 	def getRegions(self):
 		monitor = self._obj 
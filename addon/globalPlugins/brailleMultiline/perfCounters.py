@@ -0,0 +1,175 @@
+# coding: utf-8
+# perfCounters.py
+# part of brailleBufferMultiline
+# addon for NVDA
+# Travis Roth, travis@travisroth.com
+# Timing counters for the multiline buffer hot paths.
+# Off by default: the timed wrappers are only patched in while enabled, so there is no cost at all until then.
+
+import json
+import time
+from typing import (
+	Any,
+	Dict,
+	List,
+	Tuple,
+)
+import braille
+from .brailleBufferMultiline import BrailleBufferSegment, BrailleBufferContainer
+
+# histogram buckets are powers of two microseconds, the last one takes everything slower
+HISTOGRAM_BUCKETS = 24
+
+# (class, method, operation) timed while enabled
+# times are inclusive, e.g. BrailleBufferContainer.update includes its segments' update
+_TARGETS = (
+	(BrailleBufferSegment, "update", "update"),
+	(BrailleBufferSegment, "_get_windowEndPos", "window"),
+	(BrailleBufferSegment, "_set_windowEndPos", "window"),
+	(BrailleBufferSegment, "focus", "window"),
+	(BrailleBufferSegment, "writeWindow", "compose"),
+	(BrailleBufferSegment, "routeTo", "routing"),
+	(BrailleBufferContainer, "update", "update"),
+	(BrailleBufferContainer, "_get_windowBrailleCells", "compose"),
+	(BrailleBufferContainer, "routeTo", "routing"),
+	(BrailleBufferContainer, "scrollForward", "scrolling"),
+	(BrailleBufferContainer, "scrollBack", "scrolling"),
+	(BrailleBufferContainer, "flushDisplay", "displayWrite"),
+	(braille.Region, "update", "translation"),
+	(braille.BrailleHandler, "update", "displayWrite"),
+)
+
+_MISSING = object()
+
+
+class TimingStats(object):
+	"""Count, total, max and a log2 histogram of one operation, in seconds."""
+
+	__slots__ = ("count", "total", "max", "histogram")
+
+	def __init__(self):
+		self.count = 0
+		self.total = 0.0
+		self.max = 0.0
+		self.histogram = [0] * HISTOGRAM_BUCKETS
+
+	def add(self, elapsed: float) -> None:
+		self.count += 1
+		self.total += elapsed
+		if elapsed > self.max:
+			self.max = elapsed
+		self.histogram[min(int(elapsed * 1e6).bit_length(), HISTOGRAM_BUCKETS - 1)] += 1
+
+	def percentileUs(self, percent: float) -> int:
+		"""Upper bound in microseconds of the histogram bucket holding the percentile."""
+		wanted = self.count * percent / 100.0
+		seen = 0
+		for bucket, count in enumerate(self.histogram):
+			seen += count
+			if seen >= wanted:
+				return 1 << bucket
+		return 1 << (HISTOGRAM_BUCKETS - 1)
+
+	def toDict(self) -> Dict[str, Any]:
+		return {
+			"count": self.count,
+			"totalMs": self.total * 1000.0,
+			"meanUs": self.total * 1e6 / self.count if self.count else 0.0,
+			"maxUs": self.max * 1e6,
+			"p50Us": self.percentileUs(50),
+			"p95Us": self.percentileUs(95),
+			# upper bound in microseconds: count
+			"histogram": {str(1 << bucket): count for bucket, count in enumerate(self.histogram) if count},
+		}
+
+
+# (owner, operation): TimingStats
+stats: Dict[Tuple[str, str], TimingStats] = {}
+# (class, attribute): what the class had before enable() patched it
+_originals: Dict[Tuple[type, str], Any] = {}
+startTime = None
+
+
+def _owner(obj) -> str:
+	if isinstance(obj, BrailleBufferSegment):
+		return "segment %s" % getattr(obj, "segmentNumber", "?")
+	if isinstance(obj, BrailleBufferContainer):
+		return "container"
+	if isinstance(obj, braille.Region):
+		return "regions"
+	return "handler"
+
+
+def _timed(func, operation):
+	def wrapper(self, *args, **kwargs):
+		start = time.perf_counter()
+		try:
+			return func(self, *args, **kwargs)
+		finally:
+			elapsed = time.perf_counter() - start
+			key = (_owner(self), operation)
+			entry = stats.get(key)
+			if entry is None:
+				entry = stats[key] = TimingStats()
+			entry.add(elapsed)
+	wrapper.__name__ = func.__name__
+	wrapper.__doc__ = func.__doc__
+	return wrapper
+
+
+def _patch(cls, name, value):
+	if (cls, name) not in _originals:
+		_originals[(cls, name)] = cls.__dict__.get(name, _MISSING)
+	setattr(cls, name, value)
+
+
+def isEnabled() -> bool:
+	return bool(_originals)
+
+
+def enable() -> None:
+	global startTime
+	if isEnabled():
+		return
+	stats.clear()
+	startTime = time.time()
+	for cls, name, operation in _TARGETS:
+		_patch(cls, name, _timed(getattr(cls, name), operation))
+	# AutoPropertyObject properties hold the original accessors so rebuild the ones whose accessors were wrapped
+	for cls, name, operation in _TARGETS:
+		if name.startswith("_get_") or name.startswith("_set_"):
+			prop = name[5:]
+			_patch(cls, prop, property(getattr(cls, "_get_" + prop, None), getattr(cls, "_set_" + prop, None)))
+
+
+def disable() -> None:
+	for (cls, name), original in _originals.items():
+		if original is _MISSING:
+			delattr(cls, name)
+		else:
+			setattr(cls, name, original)
+	_originals.clear()
+
+
+def getRows() -> List[Dict[str, Any]]:
+	rows = []
+	for (owner, operation), entry in sorted(stats.items()):
+		row = {"owner": owner, "operation": operation}
+		row.update(entry.toDict())
+		rows.append(row)
+	return rows
+
+
+def formatTable() -> str:
+	lines = ["%-12s %-13s %8s %10s %9s %8s %8s %9s" % (
+		"owner", "operation", "count", "total ms", "mean us", "p50 us", "p95 us", "max us")]
+	for row in getRows():
+		lines.append("%-12s %-13s %8d %10.2f %9.1f %8d %8d %9.1f" % (
+			row["owner"], row["operation"], row["count"], row["totalMs"], row["meanUs"],
+			row["p50Us"], row["p95Us"], row["maxUs"]))
+	return "\n".join(lines)
+
+
+def save(path: str) -> None:
+	with open(path, "w", encoding="utf-8") as f:
+		json.dump({"since": startTime, "timings": getRows()}, f, indent=1)
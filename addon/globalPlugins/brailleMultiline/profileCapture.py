@@ -0,0 +1,111 @@
+# coding: utf-8
+# profileCapture.py
+# part of brailleBufferMultiline
+# addon for NVDA
+# Travis Roth, travis@travisroth.com
+# Profiles NVDA's main thread for a number of seconds or events when asked to, for lag reports from users.
+# Nothing runs until a capture is started.
+
+import cProfile
+import os
+import pstats
+import time
+from typing import (
+	Callable,
+	List,
+	Optional,
+	Tuple,
+)
+import wx
+from logHandler import log
+
+# source files whose functions are summarized, the saved profile has everything
+ADDON_MODULES = ("brailleBufferMultiline.py", "objectMonitor.py")
+
+
+class ProfileCapture(object):
+	"""
+	One cProfile capture at a time, stopped after a number of seconds or events, whichever comes first.
+	The profile is saved as a timestamped .prof file and the add-on's slowest functions summarized.
+	"""
+
+	def __init__(self) -> None:
+		self._profile = None
+		self._timer = None
+		self._eventsLeft = 0
+		self._directory = None
+		self._onDone = None
+
+	@property
+	def active(self) -> bool:
+		return self._profile is not None
+
+	def start(
+		self,
+		directory: str,
+		seconds: int = 0,
+		events: int = 0,
+		onDone: Optional[Callable[[str, List[Tuple[str, int, float, float]]], None]] = None
+	) -> None:
+		"""
+		@param directory: where the .prof file is written
+		@param seconds: stop after this many seconds, 0 for no time limit
+		@param events: stop after this many events noted with noteEvent, 0 for no event limit
+		@param onDone: called with the file path and summary when the capture stops
+		"""
+		if self.active:
+			return
+		self._directory = directory
+		self._eventsLeft = events
+		self._onDone = onDone
+		self._profile = cProfile.Profile()
+		self._profile.enable()
+		if seconds > 0:
+			self._timer = wx.CallLater(seconds * 1000, self.stop)
+
+	def noteEvent(self) -> None:
+		if self._profile is None or self._eventsLeft <= 0:
+			return
+		self._eventsLeft -= 1
+		if self._eventsLeft == 0:
+			# let the event being handled finish inside the capture
+			wx.CallAfter(self.stop)
+
+	def stop(self) -> Optional[str]:
+		profile = self._profile
+		if profile is None:
+			return None
+		profile.disable()
+		self._profile = None
+		if self._timer is not None:
+			self._timer.Stop()
+			self._timer = None
+		path = os.path.join(self._directory, "brailleMultiline-profile-%s.prof" % time.strftime("%Y%m%d-%H%M%S"))
+		stats = pstats.Stats(profile)
+		stats.dump_stats(path)
+		summary = summarize(stats)
+		log.info("brailleMultiline profile saved to %s\n%s" % (path, formatSummary(summary)))
+		if self._onDone is not None:
+			self._onDone(path, summary)
+		return path
+
+
+def summarize(stats: pstats.Stats, count: int = 15) -> List[Tuple[str, int, float, float]]:
+	"""The add-on's functions by cumulative time: (module:function, calls, own seconds, cumulative seconds)."""
+	rows = []
+	for (filename, line, function), (primitiveCalls, calls, ownTime, cumulativeTime, callers) in stats.stats.items():
+		module = os.path.basename(filename)
+		if module in ADDON_MODULES:
+			rows.append(("%s:%s" % (module[:-3], function), calls, ownTime, cumulativeTime))
+	rows.sort(key=lambda row: row[3], reverse=True)
+	return rows[:count]
+
+
+def formatSummary(summary: List[Tuple[str, int, float, float]]) -> str:
+	lines = ["%-60s %8s %10s %10s" % ("function", "calls", "own ms", "cum ms")]
+	for function, calls, ownTime, cumulativeTime in summary:
+		lines.append("%-60s %8d %10.2f %10.2f" % (function, calls, ownTime * 1000.0, cumulativeTime * 1000.0))
+	return "\n".join(lines)
+
+
+capture = ProfileCapture()
@@ -0,0 +1,133 @@
+# coding: utf-8
+# segmentLayout.py
+# part of brailleBufferMultiline
+# addon for NVDA
+# Travis Roth, travis@travisroth.com
+
+from array import array
+from collections import namedtuple
+from typing import (
+	List,
+	Optional,
+	Tuple,
+	Union,
+)
+
+# rows of a display, each split into columns equal segments, numbered row by row
+Grid = namedtuple("Grid", ("rows", "columns"))
+
+# _cellSegment entry of cells no segment covers
+NO_SEGMENT = 0xFFFF
+
+
+def fitToDisplay(segments: Union[int, Grid, List[int]], displaySize: int) -> Union[int, Grid, List[int]]:
+	"""A list of segment sizes that does not add up to displaySize becomes the same number of equal segments."""
+	if isinstance(segments, (int, Grid)) or sum(segments) == displaySize:
+		return segments
+	return len(segments)
+
+
+class SegmentLayout(object):
+	"""
+	Where each segment of a multiline display sits in the flat row of cells NVDA writes.
+	Built once per BrailleBufferContainer so routing and cursor math do not recalculate boundaries on every call.
+	Routing a cell is an array lookup.
+	Immutable, make a new one when the display or segments change.
+	"""
+
+	__slots__ = ("sizes", "offsets", "displaySize", "rows", "columns", "rowLength", "_cellSegment", "_cellOffset")
+
+	def __init__(self, segments: Union[int, Grid, List[int]], displaySize: int) -> None:
+		"""
+		@param segments: number of equal length segments, one per line,
+			a Grid of rows by columns of equal segments,
+			or list of segment sizes which should add up to displaySize, taken as one row
+		@type segments: int, Grid or list
+		@param displaySize: total cells of the display
+		@type displaySize: int
+		"""
+		if isinstance(segments, Grid):
+			rows, columns = segments
+		elif isinstance(segments, int):
+			rows, columns = segments, 1
+		else:
+			rows, columns = 1, len(segments)
+		rowLength = displaySize // rows
+		if isinstance(segments, (int, Grid)):
+			# equal length segments, cells left over at the end of each row are not used
+			size = rowLength // columns
+			sizes = (size,) * (rows * columns)
+			offsets = tuple(row * rowLength + column * size for row in range(rows) for column in range(columns))
+		else:
+			sizes = tuple(segments)
+			offsets = []
+			start = 0
+			for size in sizes:
+				offsets.append(start)
+				start += size
+			offsets = tuple(offsets)
+		# cell to segment and cell to position in that segment, for O(1) routing
+		cellSegment = array("H", [NO_SEGMENT]) * max(displaySize, offsets[-1] + sizes[-1] if sizes else 0)
+		cellOffset = array("H", [0]) * len(cellSegment)
+		for segment, (start, size) in enumerate(zip(offsets, sizes)):
+			cellSegment[start:start + size] = array("H", [segment]) * size
+			cellOffset[start:start + size] = array("H", range(size))
+		object.__setattr__(self, "sizes", sizes)
+		object.__setattr__(self, "offsets", offsets)
+		object.__setattr__(self, "displaySize", displaySize)
+		object.__setattr__(self, "rows", rows)
+		object.__setattr__(self, "columns", columns)
+		object.__setattr__(self, "rowLength", rowLength)
+		object.__setattr__(self, "_cellSegment", cellSegment)
+		object.__setattr__(self, "_cellOffset", cellOffset)
+
+	def __setattr__(self, name, value):
+		raise AttributeError("SegmentLayout is immutable")
+
+	def __eq__(self, other):
+		if not isinstance(other, SegmentLayout):
+			return NotImplemented
+		return self.sizes == other.sizes and self.offsets == other.offsets and self.displaySize == other.displaySize
+
+	def __hash__(self):
+		return hash((self.sizes, self.offsets, self.displaySize))
+
+	def __repr__(self):
+		if self.columns > 1 and self.rows > 1:
+			return "SegmentLayout(%r, %d)" % (Grid(self.rows, self.columns), self.displaySize)
+		return "SegmentLayout(%r, %d)" % (list(self.sizes), self.displaySize)
+
+	@property
+	def numOfSegments(self) -> int:
+		return len(self.sizes)
+
+	def getSegment(self, cell: int) -> Optional[int]:
+		"""Returns the segment a display cell belongs to, None for cells no segment covers."""
+		if 0 <= cell < len(self._cellSegment):
+			segment = self._cellSegment[cell]
+			if segment != NO_SEGMENT:
+				return segment
+		return None
+
+	def locate(self, cell: int) -> Optional[Tuple[int, int]]:
+		"""Returns (segment, position in segment) for a display cell such as a routing key, or None."""
+		if 0 <= cell < len(self._cellSegment):
+			segment = self._cellSegment[cell]
+			if segment != NO_SEGMENT:
+				return segment, self._cellOffset[cell]
+		return None
+
+	def getLeadingCells(self, segment: int) -> int:
+		"""Number of cells before a segment starts. -1 is the last segment, out of range segments have none."""
+		if segment < 0:
+			segment += len(self.sizes)
+		if 0 <= segment < len(self.sizes):
+			return self.offsets[segment]
+		return 0
+
+	def getSegmentRange(self, segment: int) -> Tuple[int, int]:
+		"""(start, end) display cells of a segment."""
+		if segment < 0:
+			segment += len(self.sizes)
+		start = self.offsets[segment]
+		return start, start + self.sizes[segment]
@@ -0,0 +1,85 @@
+# coding: utf-8
+# settingsSnapshot.py
+# part of brailleBufferMultiline
+# addon for NVDA
+# Travis Roth, travis@travisroth.com
+# Read only copy of the settings the hot paths use, so window calculations read plain attributes
+# instead of walking config.conf sections on every call.
+
+import config
+
+
+class SettingsSnapshot(object):
+	"""
+	The braille and brailleMultiline settings read by the buffers and monitors, copied out of config.conf.
+	Immutable, rebuild() makes a new one when the configuration may have changed.
+	"""
+
+	__slots__ = (
+		"wordWrap",
+		"focusContextPresentation",
+		"monitorRefreshInterval",
+		"translationCacheSize",
+		"profileSeconds",
+		"profileEvents",
+		"containerPoolSize",
+		"lineCacheLines",
+		"translationWorkers",
+		"fetchTimeout",
+		"displayWriteInterval",
+	)
+
+	def __init__(self, conf) -> None:
+		brailleSection = conf["braille"]
+		object.__setattr__(self, "wordWrap", bool(brailleSection["wordWrap"]))
+		object.__setattr__(self, "focusContextPresentation", brailleSection["focusContextPresentation"])
+		try:
+			bmSection = conf["brailleMultiline"]
+		except KeyError:
+			# the GlobalPlugin has not added the add-on's config spec yet, use its defaults
+			bmSection = {}
+		object.__setattr__(self, "monitorRefreshInterval", bmSection.get("monitorRefreshInterval", 250))
+		object.__setattr__(self, "translationCacheSize", bmSection.get("translationCacheSize", 256))
+		object.__setattr__(self, "profileSeconds", bmSection.get("profileSeconds", 10))
+		object.__setattr__(self, "profileEvents", bmSection.get("profileEvents", 0))
+		object.__setattr__(self, "containerPoolSize", bmSection.get("containerPoolSize", 4))
+		object.__setattr__(self, "lineCacheLines", bmSection.get("lineCacheLines", 5))
+		object.__setattr__(self, "translationWorkers", bmSection.get("translationWorkers", 1))
+		object.__setattr__(self, "fetchTimeout", bmSection.get("fetchTimeout", 100))
+		object.__setattr__(self, "displayWriteInterval", bmSection.get("displayWriteInterval", 50))
+
+	def __setattr__(self, name, value):
+		raise AttributeError("SettingsSnapshot is immutable")
+
+	def __repr__(self):
+		return "SettingsSnapshot(%s)" % ", ".join("%s=%r" % (name, getattr(self, name)) for name in self.__slots__)
+
+
+current = None
+
+
+def get() -> SettingsSnapshot:
+	"""The current snapshot, built on first use."""
+	if current is None:
+		return rebuild()
+	return current
+
+
+def rebuild(*args, **kwargs) -> SettingsSnapshot:
+	"""Takes a new snapshot, also the handler for the config extension points which pass arguments."""
+	global current
+	current = SettingsSnapshot(config.conf)
+	return current
+
+
+def register() -> None:
+	rebuild()
+	config.post_configProfileSwitch.register(rebuild)
+	config.post_configSave.register(rebuild)
+	config.post_configReset.register(rebuild)
+
+
+def unregister() -> None:
+	config.post_configProfileSwitch.unregister(rebuild)
+	config.post_configSave.unregister(rebuild)
+	config.post_configReset.unregister(rebuild)
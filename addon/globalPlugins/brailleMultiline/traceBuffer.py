@@ -0,0 +1,102 @@
+# coding: utf-8
+# traceBuffer.py
+# part of brailleBufferMultiline
+# addon for NVDA
+# Travis Roth, travis@travisroth.com
+# Fixed size ring of structured trace records for the hot paths, always on.
+# Records are a few integers in preallocated arrays, nothing is formatted until the ring is exported,
+# so a lag spike can be looked at afterwards without paying for debug logging all the time.
+
+from array import array
+import time
+from typing import (
+	Generator,
+	Tuple,
+)
+
+# event types and how to describe their two payload integers when exported
+TRACE_SEGMENT_UPDATE = 1
+TRACE_SEGMENT_UPDATE_SKIPPED = 2
+TRACE_SEGMENT_UPDATE_DISPLAY = 3
+TRACE_DISPLAY_WRITE = 4
+TRACE_DISPLAY_SKIPPED = 5
+TRACE_NEW_OBJECT = 6
+TRACE_NEW_OBJECT_SEGMENT = 7
+TRACE_CARET_MOVE = 8
+TRACE_PENDING_CARET_UPDATE = 9
+TRACE_CURSOR_MOVE = 10
+TRACE_DISPLAY_DEFERRED = 11
+
+EVENT_FORMATS = {
+	TRACE_SEGMENT_UPDATE: "segment update cells=%d generation=%d",
+	TRACE_SEGMENT_UPDATE_SKIPPED: "segment update skipped cells=%d generation=%d",
+	TRACE_SEGMENT_UPDATE_DISPLAY: "segment updateDisplay windowStart=%d windowEnd=%d",
+	TRACE_DISPLAY_WRITE: "display write changedSegments=%d cursor=%d",
+	TRACE_DISPLAY_SKIPPED: "display write skipped, frame unchanged %d %d",
+	TRACE_NEW_OBJECT: "new object regions=%d untargeted=%d",
+	TRACE_NEW_OBJECT_SEGMENT: "new object segment regions=%d %d",
+	TRACE_CARET_MOVE: "caret move rawText=%d pendingCaretUpdate=%d",
+	TRACE_PENDING_CARET_UPDATE: "pending caret update rawText=%d %d",
+	TRACE_CURSOR_MOVE: "cursor move rawText=%d cursorPos=%d",
+	TRACE_DISPLAY_DEFERRED: "display write deferred by %dms, %d flushes scheduled",
+}
+
+
+class TraceBuffer(object):
+	"""
+	Ring of the last size records, each an event type, segment, timestamp and two integer payloads.
+	Old records are overwritten, writing one is a handful of array stores.
+	"""
+
+	def __init__(self, size: int = 4096) -> None:
+		"""@param size: records kept, rounded up to a power of two"""
+		size = 1 << max(size - 1, 1).bit_length()
+		self.size = size
+		self._mask = size - 1
+		self._types = array("H", [0]) * size
+		self._segments = array("h", [0]) * size
+		self._times = array("d", [0.0]) * size
+		self._payloadA = array("q", [0]) * size
+		self._payloadB = array("q", [0]) * size
+		# records written since creation, the next slot is _written & _mask
+		self._written = 0
+
+	def __len__(self):
+		return min(self._written, self.size)
+
+	def trace(self, eventType: int, segment: int = -1, a: int = 0, b: int = 0) -> None:
+		index = self._written & self._mask
+		self._types[index] = eventType
+		self._segments[index] = segment
+		self._times[index] = time.perf_counter()
+		self._payloadA[index] = a
+		self._payloadB[index] = b
+		self._written += 1
+
+	def clear(self) -> None:
+		self._written = 0
+
+	def records(self) -> Generator[Tuple[float, int, int, int, int], None, None]:
+		"""(timestamp, event type, segment, a, b) oldest first."""
+		for written in range(max(self._written - self.size, 0), self._written):
+			index = written & self._mask
+			yield (self._times[index], self._types[index], self._segments[index], self._payloadA[index], self._payloadB[index])
+
+	def format(self) -> str:
+		lines = []
+		previous = None
+		for timestamp, eventType, segment, a, b in self.records():
+			delta = (timestamp - previous) * 1000.0 if previous is not None else 0.0
+			previous = timestamp
+			description = EVENT_FORMATS.get(eventType, "event " + str(eventType) + " %d %d") % (a, b)
+			lines.append("%.6f +%.3fms segment %d: %s" % (timestamp, delta, segment, description))
+		return "\n".join(lines)
+
+	def export(self, path: str) -> None:
+		with open(path, "w", encoding="utf-8") as f:
+			f.write(self.format())
+			f.write("\n")
+
+
+traceBuffer = TraceBuffer()
+trace = traceBuffer.trace
@@ -0,0 +1,186 @@
+# coding: utf-8
+# translationCache.py
+# part of brailleBufferMultiline
+# addon for NVDA
+# Travis Roth, travis@travisroth.com
+
+from collections import OrderedDict
+import threading
+from typing import (
+	Any,
+	Callable,
+	List,
+	Optional,
+	Tuple,
+)
+import louisHelper
+from logHandler import log
+
+
+class DeferredTranslations(object):
+	"""
+	Translations Region.update() asked for while reading for one request, such as a monitor refresh, that were not cached,
+	left for a worker to do with L{TranslationCache.fill}.
+	The regions were given blank placeholder cells, L{isPlaceholder} picks them out for translating again once filled.
+	"""
+
+	def __init__(self) -> None:
+		# (cache key, translate arguments) of each missed translation
+		self.requests = []
+		self._placeholders = []
+
+	def __len__(self):
+		return len(self.requests)
+
+	def add(self, key: Tuple, tableList: List[str], inbuf: str, typeform: Optional[List[int]], cursorPos: Optional[int], mode: int):
+		"""Records a translation and returns the placeholder result handed to Region.update() instead."""
+		self.requests.append((key, (list(tableList), inbuf, list(typeform) if typeform else None, cursorPos, mode)))
+		positions = list(range(len(inbuf)))
+		# Region.update() keeps brailleToRawPos as is, so it identifies the regions holding a placeholder
+		self._placeholders.append(positions)
+		return [0] * len(inbuf), positions, list(positions), cursorPos
+
+	def isPlaceholder(self, brailleToRawPos: List[int]) -> bool:
+		return any(brailleToRawPos is placeholder for placeholder in self._placeholders)
+
+
+class TranslationCache(object):
+	"""
+	LRU cache in front of louisHelper.translate.
+	Monitored lines and ancestor context regions are mostly the same text from one refresh to the next,
+	so Region.update() can skip liblouis for them.
+	Keyed by everything the translation depends on: tables, text, typeforms, cursor position and mode flags.
+	"""
+
+	def __init__(self, translate, maxSize: int = 256) -> None:
+		"""
+		@param translate: the louisHelper.translate function being cached
+		@param maxSize: most translations kept, 0 turns caching off
+		@type maxSize: int
+		"""
+		self._translate = translate
+		self._entries = OrderedDict()
+		self.maxSize = maxSize
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+		# worker threads fill the cache too, liblouis and the entries are used by one thread at a time
+		self._lock = threading.Lock()
+		# DeferredTranslations of the request whose regions the thread is reading, see runDeferring()
+		self._active = threading.local()
+
+	def __len__(self):
+		return len(self._entries)
+
+	def translate(
+		self,
+		tableList: List[str],
+		inbuf: str,
+		typeform: Optional[List[int]] = None,
+		cursorPos: Optional[int] = None,
+		mode: int = 0
+	) -> Tuple[List[int], List[int], List[int], Optional[int]]:
+		"""Same signature and result as louisHelper.translate."""
+		key = (tuple(tableList), inbuf, tuple(typeform) if typeform else None, cursorPos, mode)
+		with self._lock:
+			entry = self._entries.get(key)
+			if entry is None:
+				self.misses += 1
+				deferred = getattr(self._active, "deferred", None)
+				if deferred is not None:
+					return deferred.add(key, tableList, inbuf, typeform, cursorPos, mode)
+				entry = self._translate(tableList, inbuf, typeform=typeform, cursorPos=cursorPos, mode=mode)
+				if self.maxSize <= 0:
+					return entry
+				self._store(key, entry)
+			else:
+				self.hits += 1
+				self._entries.move_to_end(key)
+		cells, brailleToRawPos, rawToBraillePos, brailleCursorPos = entry
+		# Region.update() marks the selection in the cells in place so never hand out the cached lists
+		return list(cells), list(brailleToRawPos), list(rawToBraillePos), brailleCursorPos
+
+	def _store(self, key, entry):
+		self._entries[key] = entry
+		if len(self._entries) > self.maxSize:
+			self._entries.popitem(last=False)
+			self.evictions += 1
+
+	def runDeferring(self, deferred: DeferredTranslations, func: Callable[[], Any]) -> Any:
+		"""
+		Calls func, which reads regions for one request, and returns what it returns.
+		Translations func asks for that are not cached get placeholder cells and are recorded in deferred, for L{fill} to do later,
+		on whichever thread func runs. Translations for anything else meanwhile are not deferred.
+		"""
+		previous = getattr(self._active, "deferred", None)
+		self._active.deferred = deferred
+		try:
+			return func()
+		finally:
+			self._active.deferred = previous
+
+	def fill(self, deferred: DeferredTranslations) -> None:
+		"""Translates and caches what was deferred, for a worker thread. Each translation holds the lock on its own so the main thread waits for one at most."""
+		for key, (tableList, inbuf, typeform, cursorPos, mode) in deferred.requests:
+			with self._lock:
+				if key in self._entries:
+					continue
+				entry = self._translate(tableList, inbuf, typeform=typeform, cursorPos=cursorPos, mode=mode)
+				self._store(key, entry)
+
+	def resize(self, maxSize: int) -> None:
+		with self._lock:
+			self.maxSize = maxSize
+			while len(self._entries) > max(maxSize, 0):
+				self._entries.popitem(last=False)
+				self.evictions += 1
+
+	def clear(self) -> None:
+		with self._lock:
+			self._entries.clear()
+
+	def getStats(self) -> dict:
+		lookups = self.hits + self.misses
+		return {
+			"size": len(self._entries),
+			"maxSize": self.maxSize,
+			"hits": self.hits,
+			"misses": self.misses,
+			"evictions": self.evictions,
+			"hitRate": float(self.hits) / lookups if lookups else 0.0,
+		}
+
+
+cache = None
+_original_translate = None
+
+
+def install(maxSize: int) -> TranslationCache:
+	"""Puts a TranslationCache in front of louisHelper.translate, which braille.Region.update() calls."""
+	global cache, _original_translate
+	if cache is None:
+		_original_translate = louisHelper.translate
+		cache = TranslationCache(_original_translate, maxSize)
+		louisHelper.translate = cache.translate
+		log.debug("brailleMultiline translation cache installed with size " + str(maxSize))
+	else:
+		cache.resize(maxSize)
+	return cache
+
+
+def runDeferring(deferred: Optional[DeferredTranslations], func: Callable[[], Any]) -> Any:
+	"""
+	Calls func deferring translations missing from the cache into deferred, see L{TranslationCache.runDeferring}.
+	Just calls func when deferred is None or the cache is off, as there would be nowhere to keep the translations for the regions.
+	"""
+	if deferred is None or cache is None or cache.maxSize <= 0:
+		return func()
+	return cache.runDeferring(deferred, func)
+
+
+def uninstall() -> None:
+	global cache, _original_translate
+	if cache is not None:
+		louisHelper.translate = _original_translate
+		cache = None
+		_original_translate = None
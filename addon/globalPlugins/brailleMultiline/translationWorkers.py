@@ -0,0 +1,134 @@
+# coding: utf-8
+# translationWorkers.py
+# part of brailleBufferMultiline
+# addon for NVDA
+# Travis Roth, travis@travisroth.com
+# Worker threads translating the text of non-focus segments, so liblouis does not hold up NVDA's main thread.
+# NVDA objects are still read on the main thread, the workers only ever see text.
+# liblouis is not thread safe, so while workers run every call into it, from any thread, takes louisLock.
+
+from concurrent.futures import ThreadPoolExecutor
+import functools
+import threading
+from typing import Callable
+import braille
+import louis
+import wx
+from logHandler import log
+from . import translationCache
+from . import objectFetch
+
+# functions of the louis module guarded by louisLock, the ones missing from the installed liblouis are skipped
+LOUIS_FUNCTIONS = (
+	"translate", "translateString", "backTranslate", "backTranslateString", "hyphenate",
+	"checkTable", "compileString", "getTypeformForEmphClass", "dotsToChar", "charToDots",
+	"getTableInfo", "findTable", "listTables",
+)
+# reentrant as the louis module calls some of its own functions
+louisLock = threading.RLock()
+# the louis functions replaced while workers run
+_originalLouis = {}
+
+
+def _locked(func):
+	@functools.wraps(func)
+	def lockedFunc(*args, **kwargs):
+		with louisLock:
+			return func(*args, **kwargs)
+	return lockedFunc
+
+
+def lockLouis() -> None:
+	"""Puts louisLock around the louis functions, so a worker and the main thread, e.g. braille input back translating, never run liblouis at once."""
+	if _originalLouis:
+		return
+	for name in LOUIS_FUNCTIONS:
+		func = getattr(louis, name, None)
+		if func is not None:
+			_originalLouis[name] = func
+			setattr(louis, name, _locked(func))
+
+
+def unlockLouis() -> None:
+	for name, func in _originalLouis.items():
+		setattr(louis, name, func)
+	_originalLouis.clear()
+
+
+class TranslationWorkers(object):
+	"""
+	Threads filling the translation cache with what a main thread Region.update() deferred.
+	liblouis is called through ctypes which lets go of the GIL, so the main thread keeps handling input meanwhile,
+	though it waits for the translation under way whenever it calls liblouis itself.
+	"""
+
+	def __init__(self, workers: int = 1) -> None:
+		self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="brailleMultiline")
+
+	def submit(self, deferred: translationCache.DeferredTranslations, onDone: Callable[[], None]) -> None:
+		"""Translates deferred on a worker, then calls onDone on the main thread, also when translating failed."""
+		future = self._executor.submit(self._fill, deferred)
+		future.add_done_callback(lambda future: wx.CallAfter(self._done, future, onDone))
+
+	def _fill(self, deferred):
+		# read when the worker gets to it, the cache may have been uninstalled since the request was made
+		cache = translationCache.cache
+		if cache is None:
+			# onDone translates what is missing on the main thread
+			return
+		cache.fill(deferred)
+
+	def _done(self, future, onDone):
+		if future.exception() is not None:
+			# what is missing gets translated on the main thread when onDone updates the regions
+			log.debugWarning("brailleMultiline translation worker failed", exc_info=future.exception())
+		onDone()
+
+	def shutdown(self) -> None:
+		"""Stops the workers, waiting for the translations under way. Requests still queued return at once when the cache is uninstalled first."""
+		self._executor.shutdown(wait=True)
+
+
+def retranslate(regions, deferred: translationCache.DeferredTranslations) -> None:
+	"""
+	Updates the regions left with placeholder cells again, once the workers cached their text.
+	Each runs its own update() so what it does around the translation, such as TextInfoRegion's braille input cells, is not lost.
+	That reads the object again, but its text is found in the cache unless it changed meanwhile.
+	A region whose object does not answer this time is only translated again, from the text read before.
+	"""
+	for region in regions:
+		if not deferred.isPlaceholder(getattr(region, "brailleToRawPos", None)):
+			continue
+		obj = getattr(region, "obj", None)
+		try:
+			if obj is None:
+				region.update()
+			else:
+				objectFetch.fetch(objectFetch.getObjectKey(obj), region.update)
+		except objectFetch.FetchTimeout:
+			braille.Region.update(region)
+		except Exception:
+			log.debugWarning("brailleMultiline could not update a region after translating it", exc_info=True)
+			braille.Region.update(region)
+
+
+workers = None
+
+
+def install(count: int) -> TranslationWorkers:
+	"""Starts count worker threads, 0 for none so non-focus segments are translated on the main thread."""
+	global workers
+	uninstall()
+	if count > 0:
+		lockLouis()
+		workers = TranslationWorkers(count)
+	return workers
+
+
+def uninstall() -> None:
+	global workers
+	if workers is not None:
+		workers.shutdown()
+		workers = None
+	# no worker is left in liblouis now
+	unlockLouis()
@@ -0,0 +1,43 @@
+# coding: utf-8
+# analyzeFrames.py
+# part of brailleMultiline benchmarks
+# Summarizes a frame recording saved by the add-on's record frames command.
+# Usage: python benchmarks/analyzeFrames.py brailleMultiline-frames-*.json [--json]
+
+import argparse
+import importlib
+import json
+import os
+import sys
+import types
+
+
+def importFrameRecorder():
+	# frameRecorder has no NVDA imports, load it without running the GlobalPlugin package __init__
+	pkgName = "brailleMultiline"
+	if pkgName not in sys.modules:
+		here = os.path.dirname(os.path.abspath(__file__))
+		pkg = types.ModuleType(pkgName)
+		pkg.__path__ = [os.path.join(os.path.dirname(here), "addon", "globalPlugins", pkgName)]
+		sys.modules[pkgName] = pkg
+	return importlib.import_module(pkgName + ".frameRecorder")
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Event to frame latency, frames per event and redundant writes of a frame recording.")
+	parser.add_argument("recordings", nargs="+")
+	parser.add_argument("--json", action="store_true", help="print the summary as JSON")
+	args = parser.parse_args()
+	frameRecorder = importFrameRecorder()
+	for path in args.recordings:
+		with open(path, encoding="utf-8") as f:
+			summary = frameRecorder.analyze(json.load(f))
+		if args.json:
+			print(json.dumps({"recording": path, "summary": summary}, indent=1))
+		else:
+			print(path)
+			print(frameRecorder.formatSummary(summary))
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,374 @@
+# coding: utf-8
+# benchPipeline.py
+# part of brailleMultiline benchmarks
+# Times the multiline buffer pipeline headless against the stand-ins in nvdaStubs.
+# Usage: python benchmarks/benchPipeline.py [--quick] [--output file.json] [--compare previous.json]
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import nvdaStubs  # noqa: E402
+
+bbm = nvdaStubs.importAddon()
+import braille  # noqa: E402
+import config  # noqa: E402
+import eventHandler  # noqa: E402
+from brailleMultiline.segmentLayout import Grid  # noqa: E402
+from brailleMultiline import objectMonitor, settingsSnapshot, translationCache, translationWorkers  # noqa: E402
+
+LINES = (1, 2, 3, 4, 5)
+DISPLAY_SIZES = (40, 80, 160)
+# context regions above the focus object
+REGION_COUNTS = (2, 8, 24)
+
+
+def measure(func, minTime):
+	"""Runs func repeatedly for at least minTime seconds, returns (microseconds per call, calls)."""
+	calls = 0
+	number = 1
+	elapsed = 0.0
+	best = None
+	while elapsed < minTime:
+		start = time.perf_counter()
+		for i in range(number):
+			func()
+		taken = time.perf_counter() - start
+		elapsed += taken
+		calls += number
+		perCall = taken / number
+		best = perCall if best is None else min(best, perCall)
+		if taken < minTime / 10:
+			number *= 2
+	return best * 1e6, calls
+
+
+def makeFocusObject(ancestors, lines=200):
+	parent = None
+	for i in range(ancestors):
+		parent = nvdaStubs.FakeObject("ancestor %d grouping" % i, parent=parent)
+	text = ["line %d of the document " % i + "some words " * (i % 13) for i in range(lines)]
+	return nvdaStubs.FakeObject("document", lines=text, parent=parent)
+
+
+def setUpContainer(lines, displaySize, ancestors):
+	nvdaStubs.setDisplaySize(displaySize)
+	handler = braille.handler
+	container = bbm.BrailleBufferContainer(handler, lines)
+	handler.mainBuffer = handler.buffer = container
+	focus = makeFocusObject(ancestors)
+	handler.handleGainFocus(focus)
+	# fill the other lines as the object monitor would
+	monitored = []
+	for segment in range(lines - 1):
+		obj = nvdaStubs.FakeObject("monitored %d status " % segment * 3)
+		regions = list(braille.getFocusRegions(obj))
+		for region in regions:
+			region.targetSegment = segment
+		handler._doNewObject(regions)
+		monitored.append(obj)
+	return container, focus
+
+
+def benchLayout(lines, displaySize, ancestors, minTime):
+	handler = braille.handler
+	container, focus = setUpContainer(lines, displaySize, ancestors)
+	focusSegment = container.bufferSegments[container.focusBufferNumber]
+	textRegion = focusSegment.regions[-1]
+	results = {}
+
+	results["update.unchanged"] = measure(container.update, minTime)
+
+	def updateFocusChanged():
+		textRegion.update()
+		container.update()
+	results["update.focusChanged"] = measure(updateFocusChanged, minTime)
+
+	results["windowBrailleCells"] = measure(lambda: container.windowBrailleCells, minTime)
+
+	positions = list(range(displaySize))
+
+	def routeAll():
+		for pos in positions:
+			container.routeTo(pos)
+	usPerCall, calls = measure(routeAll, minTime)
+	results["routeTo"] = (usPerCall / len(positions), calls * len(positions))
+
+	def scrollFocus():
+		container.scrollForward()
+		container.scrollBack()
+	results["scroll.focus"] = measure(scrollFocus, minTime)
+
+	if lines > 1:
+		def scrollOther():
+			container.scrollForward(0)
+			container.scrollBack(0)
+		results["scroll.nonFocus"] = measure(scrollOther, minTime)
+
+	regions = list(braille.getFocusContextRegions(focus)) + list(braille.getFocusRegions(focus))
+
+	def newObject():
+		handler._doNewObject(iter(regions))
+	results["doNewObject"] = measure(newObject, minTime)
+	return results
+
+
+def benchChangedSegments(minTime):
+	"""update() cost against how many of 5 segments changed, on a 160 cell display."""
+	container, focus = setUpContainer(5, 160, 8)
+	results = {}
+	for changed in range(0, 6):
+		segments = container.bufferSegments[:changed]
+
+		def updateChanged():
+			for segment in segments:
+				segment.regions[-1].update()
+			container.update()
+		results[changed] = measure(updateChanged, minTime)
+	return results
+
+
+def benchDeepFocus(minTime):
+	"""Focus change latency with deep ancestor chains, e.g. web documents."""
+	results = {}
+	for lines in (1, 4):
+		for ancestors in (5, 20, 40):
+			container, focus = setUpContainer(lines, 80, ancestors)
+			results[(lines, ancestors)] = measure(lambda: braille.handler.handleGainFocus(focus), minTime)
+	return results
+
+
+def benchSeveralSegments(minTime):
+	"""
+	A focus change bringing new regions for every segment of a 4 line display, as when monitored objects change along with the focus.
+	Also checks the display is written once for all of them.
+	"""
+	handler = braille.handler
+	container, focus = setUpContainer(4, 160, 2)
+	regions = []
+	for segment in range(3):
+		for region in braille.getFocusRegions(nvdaStubs.FakeObject("changed %d status " % segment * 3)):
+			region.targetSegment = segment
+			regions.append(region)
+	regions += list(braille.getFocusContextRegions(focus)) + list(braille.getFocusRegions(focus))
+	frames = handler.display.frames
+	handler._doNewObject(iter(regions))
+	assert handler.display.frames == frames + 1, "a focus change wrote the display once per segment"
+	return measure(lambda: handler._doNewObject(iter(regions)), minTime)
+
+
+def benchGrid(minTime):
+	"""One segment changing and written out with its text as BrailleHandler.update() does, on a 10 row by 40 cell display against a single 80 cell row."""
+	results = {}
+	for name, segments, displaySize in (("10x40", Grid(10, 1), 400), ("10x40 in 2 columns", Grid(10, 2), 400), ("1x80", 1, 80)):
+		nvdaStubs.setDisplaySize(displaySize)
+		handler = braille.handler
+		container = bbm.BrailleBufferContainer(handler, segments)
+		handler.mainBuffer = handler.buffer = container
+		handler.handleGainFocus(makeFocusObject(2))
+		for segment in range(container.numOfSegments - 1):
+			regions = list(braille.getFocusRegions(nvdaStubs.FakeObject("monitored %d status " % segment * 3)))
+			for region in regions:
+				region.targetSegment = segment
+			handler._doNewObject(regions)
+		focusSegment = container.bufferSegments[container.focusBufferNumber]
+		textRegion = focusSegment.regions[-1]
+
+		def oneSegmentChanged():
+			textRegion.update()
+			container.update()
+			focusSegment.windowStartPos = focusSegment.windowStartPos
+			container.windowBrailleCells
+			container.windowRawText
+		results[name] = measure(oneSegmentChanged, minTime)
+	return results
+
+
+def benchDocument(minTime):
+	"""Continuous document mode on a 4 line display in a 100000 line document: moving the caret a line and paging."""
+	nvdaStubs.setDisplaySize(160)
+	handler = braille.handler
+	container = bbm.BrailleBufferContainer(handler, 4)
+	handler.mainBuffer = handler.buffer = container
+	focus = makeFocusObject(2, lines=100000)
+	focus.caretLine = 50000
+	handler.handleGainFocus(focus)
+	container.setContinuousDocument(True)
+	focusSegment = container.bufferSegments[container.focusBufferNumber]
+	# back and forth so the caret stays in the middle of the document however many calls are measured
+	direction = [1]
+
+	def moveCaret(lines):
+		if not 1000 < focus.caretLine < 99000:
+			direction[0] = -direction[0]
+		container.documentWindow.moveCaret(lines * direction[0])
+		handler._doCursorMove(focusSegment.regions[-1])
+
+	results = {}
+	results["line"] = measure(lambda: moveCaret(1), minTime)
+	results["page"] = measure(lambda: moveCaret(container.numOfSegments), minTime)
+	container.setContinuousDocument(False)
+	return results
+
+
+def benchMonitorRefresh(minTime):
+	"""
+	Main thread cost of refreshing a monitored line whose text is new every time, translated on the main thread against by a worker.
+	Also checks every refresh with a worker really handed its translations to it,
+	and that the monitor asks for its object's events from the background only while it runs.
+	"""
+	nvdaStubs.setDisplaySize(80)
+	handler = braille.handler
+	container = bbm.BrailleBufferContainer(handler, 2)
+	handler.mainBuffer = handler.buffer = container
+	handler.handleGainFocus(makeFocusObject(2))
+	translationCache.install(256)
+	results = {}
+	for workerCount in (0, 1):
+		workers = translationWorkers.install(workerCount)
+		obj = nvdaStubs.FakeObject("monitored status", lines=["status"])
+		monitor = objectMonitor.ObjectMonitor(obj, 0)
+		requested = set((eventName, obj.processID, obj.windowClassName) for eventName in objectMonitor.MONITORED_EVENTS)
+		assert requested <= eventHandler._acceptEvents, "the monitor did not ask for its object's events"
+		submitted = []
+		if workers is not None:
+			submit = workers.submit
+
+			def countingSubmit(deferred, onDone):
+				submitted.append(len(deferred))
+				submit(deferred, onDone)
+			workers.submit = countingSubmit
+		refreshes = [0]
+
+		def refresh():
+			refreshes[0] += 1
+			obj.lines[0] = "status changed %d times with %d workers" % (refreshes[0], workerCount)
+			monitor.refresh()
+		results[workerCount] = measure(refresh, minTime)
+		monitor.terminate()
+		assert not requested & eventHandler._acceptEvents, "the stopped monitor still asks for its object's events"
+		if workers is not None:
+			assert len(submitted) == refreshes[0] and all(submitted), "monitor refreshes did not hand their translations to the workers"
+		translationWorkers.uninstall()
+	translationCache.uninstall()
+	# worker results for the terminated monitors are dropped
+	nvdaStubs.runPendingCalls()
+	return results
+
+
+def benchScrollMonitored(minTime):
+	"""
+	Scrolling a monitored line by a line, shown from the lines read ahead and by moving its caret when they are turned off.
+	Also checks the monitored line shows the line scrolled to either way.
+	"""
+	nvdaStubs.setDisplaySize(80)
+	handler = braille.handler
+	section = config.conf["brailleMultiline"]
+	savedLines = section["lineCacheLines"]
+	results = {}
+	for cacheLines in (savedLines, 0):
+		section["lineCacheLines"] = cacheLines
+		settingsSnapshot.rebuild()
+		container = bbm.BrailleBufferContainer(handler, 2)
+		handler.mainBuffer = handler.buffer = container
+		handler.handleGainFocus(makeFocusObject(2))
+		obj = nvdaStubs.FakeObject("monitored log", lines=["log entry %d" % i for i in range(200)])
+		monitor = objectMonitor.ObjectMonitor(obj, 0)
+		nvdaStubs.runPendingCalls()
+		segment = container.bufferSegments[0]
+		# 100 lines down then back up so there is always a line to scroll to
+		scrolls = [0]
+
+		def scroll():
+			if scrolls[0] // 100 % 2:
+				container.scrollBack(0)
+			else:
+				container.scrollForward(0)
+			scrolls[0] += 1
+			container.update()
+		for i in range(3):
+			scroll()
+		assert segment.rawText.endswith("log entry 3"), "scrolling the monitored line did not show the line scrolled to"
+		results[cacheLines] = measure(scroll, minTime)
+		monitor.terminate()
+		nvdaStubs.runPendingCalls()
+	section["lineCacheLines"] = savedLines
+	settingsSnapshot.rebuild()
+	return results
+
+
+def run(minTime):
+	rows = []
+
+	def add(benchmark, result, **params):
+		usPerCall, calls = result
+		row = {"benchmark": benchmark, "usPerCall": round(usPerCall, 3), "calls": calls}
+		row.update(params)
+		rows.append(row)
+
+	for lines in LINES:
+		for displaySize in DISPLAY_SIZES:
+			for ancestors in REGION_COUNTS:
+				for name, result in benchLayout(lines, displaySize, ancestors, minTime).items():
+					add(name, result, lines=lines, displaySize=displaySize, contextRegions=ancestors)
+	for changed, result in benchChangedSegments(minTime).items():
+		add("update.changedSegments", result, lines=5, displaySize=160, changedSegments=changed)
+	for (lines, ancestors), result in benchDeepFocus(minTime).items():
+		add("focusChange.deepAncestors", result, lines=lines, displaySize=80, contextRegions=ancestors)
+	add("focusChange.severalSegments", benchSeveralSegments(minTime), lines=4, displaySize=160, changedSegments=4)
+	for layout, result in benchGrid(minTime).items():
+		add("grid.oneSegmentChanged", result, layout=layout)
+	for move, result in benchDocument(minTime).items():
+		add("continuousDocument.move", result, lines=4, displaySize=160, move=move)
+	for workerCount, result in benchMonitorRefresh(minTime).items():
+		add("monitor.refresh", result, lines=2, displaySize=80, translationWorkers=workerCount)
+	for cacheLines, result in benchScrollMonitored(minTime).items():
+		add("monitor.scroll", result, lines=2, displaySize=80, lineCacheLines=cacheLines)
+	return rows
+
+
+def rowKey(row):
+	return tuple(sorted((k, v) for k, v in row.items() if k not in ("usPerCall", "calls")))
+
+
+def compare(rows, previousFile):
+	with open(previousFile) as f:
+		previous = {rowKey(row): row["usPerCall"] for row in json.load(f)["results"]}
+	print("%-28s %-50s %10s %10s %7s" % ("benchmark", "parameters", "before", "after", "ratio"))
+	for row in rows:
+		before = previous.get(rowKey(row))
+		if not before:
+			continue
+		params = ", ".join("%s=%s" % (k, v) for k, v in rowKey(row) if k != "benchmark")
+		print("%-28s %-50s %10.2f %10.2f %7.2f" % (row["benchmark"], params, before, row["usPerCall"], row["usPerCall"] / before))
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Benchmark the brailleMultiline buffer pipeline without NVDA.")
+	parser.add_argument("--output", default="benchmarkResults.json", help="JSON file to write results to")
+	parser.add_argument("--quick", action="store_true", help="shorter runs, noisier numbers")
+	parser.add_argument("--compare", help="earlier results file to compare against")
+	args = parser.parse_args()
+	rows = run(0.02 if args.quick else 0.2)
+	data = {
+		"meta": {
+			"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+			"python": platform.python_version(),
+			"platform": platform.platform(),
+			"unit": "microseconds per call",
+		},
+		"results": rows,
+	}
+	with open(args.output, "w") as f:
+		json.dump(data, f, indent=1)
+	print("wrote %d results to %s" % (len(rows), args.output))
+	if args.compare:
+		compare(rows, args.compare)
+
+
+if __name__ == "__main__":
+	main()
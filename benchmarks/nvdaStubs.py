@@ -0,0 +1,693 @@
+# coding: utf-8
+# nvdaStubs.py
+# part of brailleMultiline benchmarks
+# Lightweight stand-ins for the NVDA modules the add-on imports so the
+# buffer pipeline can be timed headless on any platform.
+# Only the behaviour the add-on relies on is reproduced; translation is a
+# cheap deterministic character to cell mapping instead of liblouis.
+
+import os
+import sys
+import tempfile
+import types
+import enum
+
+
+def _module(name, **attrs):
+	mod = types.ModuleType(name)
+	mod.__dict__.update(attrs)
+	sys.modules[name] = mod
+	if "." in name:
+		parent, child = name.rsplit(".", 1)
+		setattr(sys.modules[parent], child, mod)
+	return mod
+
+
+class _Action(object):
+	# extensionPoints.Action
+	def __init__(self):
+		self._handlers = []
+
+	def register(self, handler):
+		self._handlers.append(handler)
+
+	def unregister(self, handler):
+		if handler in self._handlers:
+			self._handlers.remove(handler)
+
+	def notify(self, **kwargs):
+		for handler in list(self._handlers):
+			handler(**kwargs)
+
+
+class _Log(object):
+	IO = 12
+	DEBUG = 10
+
+	def debug(self, *args, **kwargs):
+		pass
+
+	info = warning = error = exception = io = debugWarning = debug
+
+	def isEnabledFor(self, level):
+		return False
+
+
+class _AutoPropertyType(type):
+	# baseObject.AutoPropertyType: _get_x/_set_x pairs become property x
+	def __init__(cls, name, bases, dict_):
+		super().__init__(name, bases, dict_)
+		props = set()
+		for attr in dict_:
+			if attr.startswith("_get_") or attr.startswith("_set_"):
+				props.add(attr[5:])
+		for prop in props:
+			getter = getattr(cls, "_get_" + prop, None)
+			setter = getattr(cls, "_set_" + prop, None)
+			setattr(cls, prop, property(getter, setter))
+
+
+class AutoPropertyObject(metaclass=_AutoPropertyType):
+	pass
+
+
+class _Conf(dict):
+	def __init__(self, *args, **kwargs):
+		super().__init__(*args, **kwargs)
+		self.spec = {}
+
+	def __missing__(self, key):
+		section = self[key] = {}
+		return section
+
+	def save(self):
+		pass
+
+
+# Fake wx: callbacks are queued and run explicitly by the benchmarks.
+_pendingCalls = []
+
+
+class COMError(Exception):
+	def __init__(self, hresult, text=None, details=None):
+		super().__init__(hresult, text, details)
+		self.hresult = hresult
+
+
+class CallCancelled(Exception):
+	pass
+
+
+def _callAfter(func, *args, **kwargs):
+	_pendingCalls.append((func, args, kwargs))
+
+
+class _CallLater(object):
+	def __init__(self, millis, func, *args, **kwargs):
+		self._call = (func, args, kwargs)
+		self._running = True
+		_pendingCalls.append((self._fire, (), {}))
+
+	def _fire(self):
+		if self._running:
+			self._running = False
+			func, args, kwargs = self._call
+			func(*args, **kwargs)
+
+	def IsRunning(self):
+		return self._running
+
+	def Stop(self):
+		self._running = False
+
+
+def runPendingCalls():
+	"""Runs queued wx.CallAfter/CallLater callbacks, including ones they queue."""
+	count = 0
+	while _pendingCalls:
+		func, args, kwargs = _pendingCalls.pop(0)
+		func(*args, **kwargs)
+		count += 1
+	return count
+
+
+def _louisTranslate(tableList, inbuf, typeform=None, cursorPos=0, mode=0):
+	# stand-in for louis.translate with dotsIO: one cell per character, spaces blank
+	outbuf = "".join(chr(0x8000 | (0 if c == " " else (ord(c) & 0x3f) | 1)) for c in inbuf)
+	positions = list(range(len(inbuf)))
+	return outbuf, typeform, positions, list(positions), cursorPos
+
+
+def _louisBackTranslate(tableList, inbuf, typeform=None, cursorPos=0, mode=0):
+	positions = list(range(len(inbuf)))
+	return inbuf, typeform, positions, list(positions), cursorPos
+
+
+def _translate(tableList, inbuf, typeform=None, cursorPos=None, mode=0):
+	# stand-in for louisHelper.translate, calling the louis module as it does
+	outbuf, typeform, brailleToRawPos, rawToBraillePos, brailleCursorPos = sys.modules["louis"].translate(
+		tableList, inbuf, typeform=typeform, cursorPos=cursorPos or 0, mode=mode)
+	cells = [ord(c) - 0x8000 for c in outbuf]
+	return cells, brailleToRawPos, rawToBraillePos, brailleCursorPos if cursorPos is not None else None
+
+
+class Region(object):
+	def __init__(self):
+		self.rawText = ""
+		self.rawTextTypeforms = None
+		self.cursorPos = None
+		self.selectionStart = self.selectionEnd = None
+		self.brailleCells = []
+		self.brailleCursorPos = None
+		self.brailleSelectionStart = self.brailleSelectionEnd = None
+		self.hidePreviousRegions = False
+		self.focusToHardLeft = False
+		self.routed = None
+
+	def update(self):
+		mode = 0
+		(self.brailleCells, self.brailleToRawPos, self.rawToBraillePos,
+			self.brailleCursorPos) = sys.modules["louisHelper"].translate(
+			["en-ueb-g1.ctb", "braille-patterns.cti"],
+			self.rawText,
+			typeform=self.rawTextTypeforms,
+			mode=mode,
+			cursorPos=self.cursorPos
+		)
+		if self.selectionStart is not None and self.selectionEnd is not None:
+			try:
+				self.brailleSelectionStart = self.rawToBraillePos[self.selectionStart]
+				if self.selectionEnd >= len(self.rawText):
+					self.brailleSelectionEnd = len(self.brailleCells)
+				else:
+					self.brailleSelectionEnd = self.rawToBraillePos[self.selectionEnd]
+				for pos in range(self.brailleSelectionStart, self.brailleSelectionEnd):
+					self.brailleCells[pos] |= 0xC0
+			except IndexError:
+				pass
+
+	def routeTo(self, braillePos):
+		self.routed = braillePos
+
+	def nextLine(self):
+		pass
+
+	def previousLine(self):
+		pass
+
+
+class TextRegion(Region):
+	def __init__(self, text):
+		super().__init__()
+		self.rawText = text
+
+
+class FakeTextInfo(object):
+	"""TextInfo over a list of lines; positions are line numbers."""
+
+	def __init__(self, obj, line):
+		self.obj = obj
+		self.line = line
+
+	def copy(self):
+		return FakeTextInfo(self.obj, self.line)
+
+	def expand(self, unit):
+		pass
+
+	def collapse(self, end=False):
+		pass
+
+	def move(self, unit, direction, endPoint=None):
+		dest = max(0, min(len(self.obj.lines) - 1, self.line + direction))
+		moved = dest - self.line
+		self.line = dest
+		return moved
+
+	def compareEndPoints(self, other, which):
+		return (self.line > other.line) - (self.line < other.line)
+
+	def updateCaret(self):
+		self.obj.caretLine = self.line
+
+	def _get_text(self):
+		return self.obj.lines[self.line]
+
+	text = property(_get_text)
+
+
+class TextInfoRegion(Region):
+	def __init__(self, obj):
+		super().__init__()
+		self.obj = obj
+		self.pendingCaretUpdate = False
+
+	def _getSelection(self):
+		return FakeTextInfo(self.obj, self.obj.caretLine)
+
+	def _getReadingUnit(self):
+		return "line"
+
+	def update(self):
+		self._readingInfo = self._getSelection()
+		self.rawText = self._readingInfo.text
+		self.cursorPos = 0
+		super().update()
+
+	def _setCursor(self, info):
+		info.updateCaret()
+
+	def nextLine(self):
+		dest = self._readingInfo.copy()
+		if dest.move("line", 1):
+			self._setCursor(dest)
+
+	def previousLine(self):
+		dest = self._readingInfo.copy()
+		if dest.move("line", -1):
+			self._setCursor(dest)
+
+
+class FakeObject(object):
+	"""Minimal NVDAObject: a name/role and optionally text lines."""
+	_nextID = 1
+
+	def __init__(self, name, lines=None, parent=None):
+		self.name = name
+		self.role = 8
+		self.value = None
+		self.lines = lines
+		self.caretLine = 0
+		self.parent = parent
+		self.windowHandle = 1000
+		self.processID = 2000
+		self.windowClassName = "Edit"
+		self.event_objectID = -4
+		self.event_childID = FakeObject._nextID
+		FakeObject._nextID += 1
+
+	def makeTextInfo(self, position):
+		return FakeTextInfo(self, self.caretLine)
+
+	def setFocus(self):
+		pass
+
+
+def getFocusRegions(obj, review=False):
+	region = TextRegion(obj.name + (" " if obj.lines else ""))
+	region.obj = obj
+	region.update()
+	yield region
+	if obj.lines:
+		region2 = TextInfoRegion(obj)
+		region2.update()
+		yield region2
+
+
+def getFocusContextRegions(obj, oldFocusRegions=None):
+	ancestors = []
+	parent = obj.parent
+	while parent is not None:
+		ancestors.insert(0, parent)
+		parent = parent.parent
+	for index, ancestor in enumerate(ancestors):
+		region = TextRegion(ancestor.name + " ")
+		region._focusAncestorIndex = index
+		region.update()
+		yield region
+
+
+def rindex(seq, item, start=0, end=None):
+	if end is None:
+		end = len(seq)
+	if end < 0:
+		end = len(seq) + end
+	for index in range(end - 1, start - 1, -1):
+		if seq[index] == item:
+			return index
+	raise ValueError("%r is not in sequence" % item)
+
+
+class BrailleBuffer(AutoPropertyObject):
+	# braille.BrailleBuffer as of NVDA 2023.1
+
+	def __init__(self, handler):
+		self.handler = handler
+		self.regions = []
+		self.rawText = ""
+		self.brailleCells = []
+		self.cursorPos = None
+		self.windowStartPos = 0
+		self._savedWindow = 0, 0
+
+	def clear(self):
+		self.regions = []
+		self.rawText = ""
+		self.cursorPos = None
+		self.brailleCursorPos = None
+		self.brailleCells = []
+		self.windowStartPos = 0
+
+	def _get_visibleRegions(self):
+		if not self.regions:
+			return
+		if self.regions[-1].hidePreviousRegions:
+			yield self.regions[-1]
+			return
+		for region in self.regions:
+			yield region
+
+	def _get_regionsWithPositions(self):
+		start = 0
+		for region in self.visibleRegions:
+			end = start + len(region.brailleCells)
+			yield region, start, end
+			start = end
+
+	def bufferPosToRegionPos(self, bufferPos):
+		for region, start, end in self.regionsWithPositions:
+			if end > bufferPos:
+				return region, bufferPos - start
+		raise LookupError("No such position")
+
+	def regionPosToBufferPos(self, region, pos, allowNearest=False):
+		start = 0
+		for testRegion, start, end in self.regionsWithPositions:
+			if region == testRegion:
+				if pos < end - start:
+					return start + pos
+				elif allowNearest:
+					return end
+				break
+		if allowNearest:
+			return start
+		raise LookupError("No such position")
+
+	def bufferPosToWindowPos(self, bufferPos):
+		if not (self.windowStartPos <= bufferPos < self.windowEndPos):
+			raise LookupError("Buffer position not in window")
+		return bufferPos - self.windowStartPos
+
+	def _get_windowEndPos(self):
+		endPos = self.windowStartPos + self.handler.displaySize
+		cellsLen = len(self.brailleCells)
+		if endPos >= cellsLen:
+			return cellsLen
+		return endPos
+
+	def _set_windowEndPos(self, endPos):
+		self.windowStartPos = max(0, endPos - self.handler.displaySize)
+
+	def _nextWindow(self):
+		oldStart = self.windowStartPos
+		end = self.windowEndPos
+		if end < len(self.brailleCells):
+			self.windowStartPos = end
+		return self.windowStartPos != oldStart
+
+	def _previousWindow(self):
+		start = self.windowStartPos
+		if start > 0:
+			self.windowEndPos = start
+		return self.windowStartPos != start
+
+	def scrollForward(self):
+		if not self._nextWindow():
+			if self.regions:
+				self.regions[-1].nextLine()
+		else:
+			self.updateDisplay()
+
+	def scrollBack(self):
+		if not self._previousWindow():
+			if self.regions:
+				self.regions[-1].previousLine()
+		else:
+			self.updateDisplay()
+
+	def scrollTo(self, region, pos):
+		pos = self.regionPosToBufferPos(region, pos)
+		if pos >= self.windowEndPos:
+			self.windowEndPos = pos + 1
+		elif pos < self.windowStartPos:
+			self.windowStartPos = pos
+		self.updateDisplay()
+
+	def focus(self, region):
+		pos = self.regionPosToBufferPos(region, 0)
+		self.windowStartPos = pos
+		if region.focusToHardLeft:
+			return
+		end = self.windowEndPos
+		if end - pos < self.handler.displaySize:
+			self.windowEndPos = end
+
+	def update(self):
+		self.rawText = ""
+		self.brailleCells = []
+		self.cursorPos = None
+		start = 0
+		for region in self.visibleRegions:
+			cells = region.brailleCells
+			self.rawText += region.rawText
+			self.brailleCells.extend(cells)
+			if region.brailleCursorPos is not None:
+				self.cursorPos = start + region.brailleCursorPos
+			start += len(cells)
+
+	def updateDisplay(self):
+		if self is self.handler.buffer:
+			self.handler.update()
+
+	def _get_cursorWindowPos(self):
+		if self.cursorPos is None:
+			return None
+		try:
+			return self.bufferPosToWindowPos(self.cursorPos)
+		except LookupError:
+			return None
+
+	def _get_windowRawText(self):
+		return self.rawText[self.windowStartPos:self.windowEndPos]
+
+	def _get_windowBrailleCells(self):
+		return self.brailleCells[self.windowStartPos:self.windowEndPos]
+
+	def routeTo(self, windowPos):
+		pos = self.windowStartPos + windowPos
+		if pos >= self.windowEndPos:
+			return
+		region, pos = self.bufferPosToRegionPos(pos)
+		region.routeTo(pos)
+
+	def getTextInfoForWindowPos(self, windowPos):
+		return None
+
+	def saveWindow(self):
+		self._savedWindow = self.bufferPosToRegionPos(self.windowStartPos)
+
+	def restoreWindow(self):
+		region, pos = self._savedWindow
+		try:
+			self.windowStartPos = self.regionPosToBufferPos(region, pos, allowNearest=True)
+		except LookupError:
+			pass
+
+
+class FakeDisplay(object):
+	name = "noBraille"
+	numCells = 80
+	numRows = 1
+
+	def __init__(self):
+		self.frames = 0
+		self.lastCells = None
+
+	def display(self, cells):
+		self.frames += 1
+		self.lastCells = cells
+
+
+class BrailleHandler(AutoPropertyObject):
+	# the parts of braille.BrailleHandler the add-on touches
+
+	def __init__(self):
+		self.display = FakeDisplay()
+		self.displaySize = self.display.numCells
+		self.mainBuffer = BrailleBuffer(self)
+		self.messageBuffer = BrailleBuffer(self)
+		self.buffer = self.mainBuffer
+		self.enabled = True
+		self._tether = "focus"
+		self._cursorPos = None
+		self._cells = []
+		self._rawText = ""
+		self._keyCountForLastMessage = 0
+
+	def getTether(self):
+		return self._tether
+
+	def setTether(self, tether, auto=False):
+		self._tether = tether
+
+	def update(self):
+		cells = self.buffer.windowBrailleCells
+		# kept for the braille viewer
+		self._rawText = self.buffer.windowRawText
+		self._cells = cells + [0] * (self.displaySize - len(cells))
+		self._cursorPos = self.buffer.cursorWindowPos
+		self._updateDisplay()
+
+	def _updateDisplay(self):
+		self.display.display(list(self._cells))
+
+	def _doNewObject(self, regions):
+		self.mainBuffer.clear()
+		for region in regions:
+			self.mainBuffer.regions.append(region)
+		self.mainBuffer.update()
+		self.mainBuffer.focus(region)
+		self.scrollToCursorOrSelection(region)
+		if self.buffer is self.mainBuffer:
+			self.update()
+
+	def _doCursorMove(self, region):
+		self.mainBuffer.saveWindow()
+		region.update()
+		self.mainBuffer.update()
+		self.mainBuffer.restoreWindow()
+		self.scrollToCursorOrSelection(region)
+		if self.buffer is self.mainBuffer:
+			self.update()
+
+	def scrollToCursorOrSelection(self, region):
+		if region.brailleCursorPos is not None:
+			self.mainBuffer.scrollTo(region, region.brailleCursorPos)
+
+	def handleGainFocus(self, obj, shouldAutoTether=True):
+		regions = list(getFocusContextRegions(obj)) + list(getFocusRegions(obj))
+		self._doNewObject(regions)
+
+	def _dismissMessage(self):
+		self.buffer = self.mainBuffer
+
+
+# eventHandler's record of events requested from background windows, as NVDA keeps it
+_acceptEvents = set()
+_acceptEventsByProcess = {}
+
+
+def _requestEvents(eventName=None, processId=None, windowClassName=None):
+	if not eventName or not processId or not windowClassName:
+		raise ValueError("eventName, processId or windowClassName not specified")
+	entry = (eventName, processId, windowClassName)
+	_acceptEventsByProcess.setdefault(processId, set()).add(entry)
+	_acceptEvents.add(entry)
+
+
+def install():
+	"""Registers the stand-in modules in sys.modules. Safe to call twice."""
+	if "braille" in sys.modules and getattr(sys.modules["braille"], "_isStandIn", False):
+		return
+	configPath = tempfile.mkdtemp(prefix="brailleMultilineBench")
+	_module("baseObject", AutoPropertyObject=AutoPropertyObject, AutoPropertyType=_AutoPropertyType)
+	_module("logHandler", log=_Log())
+	_module("extensionPoints", Action=_Action)
+	conf = _Conf({
+		"braille": {
+			"wordWrap": True,
+			"focusContextPresentation": "changedContext",
+			"tetherTo": "focus",
+			"autoTether": True,
+			"expandAtCursor": True,
+			"translationTable": "en-ueb-g1.ctb",
+		},
+		# defaults from the add-on's config spec
+		"brailleMultiline": {
+			"monitorRefreshInterval": 250,
+			"translationCacheSize": 256,
+			"profileSeconds": 10,
+			"profileEvents": 0,
+			"containerPoolSize": 4,
+			"lineCacheLines": 5,
+			"continuousDocument": False,
+			"translationWorkers": 1,
+			"fetchTimeout": 100,
+			"displayWriteInterval": 50,
+		},
+	})
+	_module("config", conf=conf,
+		post_configProfileSwitch=_Action(), post_configSave=_Action(), post_configReset=_Action())
+
+	class TetherTo(enum.Enum):
+		AUTO = "auto"
+		FOCUS = "focus"
+		REVIEW = "review"
+
+	class ShowMessages(enum.IntEnum):
+		DISABLED = 0
+		USE_TIMEOUT = 1
+		SHOW_INDEFINITELY = 2
+
+	class ReportTableHeaders(enum.IntEnum):
+		OFF = 0
+		ROWS = 1
+
+	_module("config.configFlags", TetherTo=TetherTo, ShowMessages=ShowMessages, ReportTableHeaders=ReportTableHeaders)
+	_module("wx", CallAfter=_callAfter, CallLater=_CallLater)
+	_module("ui", message=lambda text: None, browseableMessage=lambda text, title=None: None)
+	_module("speech", speakMessage=lambda text: None)
+	_module("controlTypes")
+	_module("textInfos", POSITION_CARET="caret", POSITION_FIRST="first", UNIT_LINE="line",
+		UNIT_CHARACTER="character", UNIT_STORY="story")
+	_module("keyboardHandler", keyCounter=0)
+	_module("utils")
+	_module("utils.security", objectBelowLockScreenAndWindowsIsLocked=lambda obj: False)
+	_module("NVDAObjects", NVDAObject=FakeObject)
+	_module("globalVars", appArgs=types.SimpleNamespace(configPath=configPath))
+	_module("louis", translate=_louisTranslate, backTranslate=_louisBackTranslate)
+	_module("louisHelper", translate=_translate)
+	_module("comtypes", COMError=COMError)
+	# nothing is ever cancelled without a watchdog watching the main thread
+	_module("watchdog", CallCancelled=CallCancelled, isAttemptingRecovery=False)
+	_module("eventHandler", requestEvents=_requestEvents, _acceptEvents=_acceptEvents, _acceptEventsByProcess=_acceptEventsByProcess)
+	focusHolder = {}
+	_module("api",
+		getFocusObject=lambda: focusHolder.get("focus"),
+		getNavigatorObject=lambda: focusHolder.get("focus"),
+		setFocusObject=lambda obj: focusHolder.__setitem__("focus", obj))
+	braille = _module("braille",
+		_isStandIn=True,
+		Region=Region,
+		TextInfoRegion=TextInfoRegion,
+		BrailleBuffer=BrailleBuffer,
+		BrailleHandler=BrailleHandler,
+		getFocusRegions=getFocusRegions,
+		getFocusContextRegions=getFocusContextRegions,
+		rindex=rindex,
+		louisHelper=sys.modules["louisHelper"],
+		displayChanged=_Action(),
+		displaySizeChanged=_Action(),
+	)
+	braille.handler = BrailleHandler()
+
+
+def setDisplaySize(numCells):
+	"""Pretends a display with numCells cells is connected."""
+	handler = sys.modules["braille"].handler
+	handler.display.numCells = numCells
+	handler.displaySize = numCells
+
+
+def importAddon():
+	"""Imports the add-on modules without running the GlobalPlugin package __init__ (which needs gui)."""
+	install()
+	pkgName = "brailleMultiline"
+	if pkgName not in sys.modules:
+		here = os.path.dirname(os.path.abspath(__file__))
+		pkgDir = os.path.join(os.path.dirname(here), "addon", "globalPlugins", pkgName)
+		pkg = types.ModuleType(pkgName)
+		pkg.__path__ = [pkgDir]
+		sys.modules[pkgName] = pkg
+	import importlib
+	return importlib.import_module(pkgName + ".brailleBufferMultiline")